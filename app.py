@@ -1,22 +1,137 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
+from werkzeug.utils import safe_join
 import os
-import subprocess
-import uuid
+import json
 import sys
-import time
 
 # 导入配置
 from config import config
+from comfyui_client import ComfyUIClient
+from backend_pool import BackendPool
+from embedding_cache import EmbeddingCache
+from result_cache import ResultCache
+from job_queue import IdempotencyConflict, JobManager
+from workflow_registry import WorkflowRegistry
+from retention import RetentionManager
+from thumbnails import FORMATS, VARIANT_PREFIX, ThumbnailService, format_supported
+from content_store import file_digest, store_bytes
+import metrics
+from metrics import stage_timer
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+# Two images plus multipart overhead; each image is checked on its own in /upload
+app.config['MAX_CONTENT_LENGTH'] = 2 * config.UPLOAD_MAX_BYTES + 1024 * 1024
 
 # 使用配置中的路径
 UPLOAD_FOLDER = config.UPLOAD_FOLDER
 GENERATED_FOLDER = config.GENERATED_FOLDER
-SCRIPT_PATH = config.SCRIPT_PATH
-PYTHON_EXECUTABLE = config.PYTHON_EXECUTABLE
+
+# Files in GENERATED_FOLDER that are overwritten in place
+MUTABLE_ALIASES = {'latest_image.png'}
+
+# Components, built by start_services() at server startup rather than on import
+retention = None
+thumbnails = None
+workflows = None
+embedding_cache = None
+backends = None
+result_cache = None
+jobs = None
+
+def init_services():
+    """Build the janitor, caches, workflow registry, backend pool and job manager (once)."""
+    global retention, thumbnails, workflows, embedding_cache, backends, result_cache, jobs
+    if jobs is not None:
+        return
+
+    # Background janitor for generated outputs and staged inputs
+    retention = RetentionManager(interval=config.RETENTION_INTERVAL)
+    retention.add_area(
+        'generated', GENERATED_FOLDER, prefixes=('generated_', VARIANT_PREFIX),
+        max_bytes=config.GENERATED_MAX_BYTES, max_age=config.GENERATED_MAX_AGE,
+    )
+    if config.COMFYUI_IMAGE_TRANSFER == 'filesystem' and config.COMFYUI_INPUT_DIR:
+        # Keep inputs of prompts that may still be queued in ComfyUI
+        retention.add_area(
+            'comfyui_input', config.COMFYUI_INPUT_DIR, prefixes=('ref_', 'ipadpt_'),
+            max_bytes=config.COMFYUI_INPUT_MAX_BYTES, max_age=config.COMFYUI_INPUT_MAX_AGE,
+            min_age=config.COMFYUI_JOB_TIMEOUT,
+        )
+
+    # Resized WebP/AVIF variants for /generated/<file>?w=&fmt=
+    thumbnails = ThumbnailService(
+        GENERATED_FOLDER,
+        widths=config.THUMBNAIL_WIDTHS,
+        default_width=config.THUMBNAIL_DEFAULT_WIDTH,
+        default_format=config.THUMBNAIL_DEFAULT_FORMAT,
+        workers=config.THUMBNAIL_WORKERS,
+        retention=retention,
+    )
+
+    # Workflow templates, parsed once and reloaded when their files change
+    workflows = WorkflowRegistry(config.WORKFLOWS_FOLDER, reload_interval=config.WORKFLOW_RELOAD_INTERVAL)
+
+    # Reference embeddings are shared by every backend
+    embedding_cache = None
+    if config.EMBEDDING_CACHE_ENABLED:
+        embedding_cache = EmbeddingCache(config.EMBEDDING_CACHE_FOLDER, config.EMBEDDING_CACHE_MAX_BYTES)
+
+    # One in-process ComfyUI client per backend, scheduled by least load
+    backends = BackendPool([
+        ComfyUIClient(
+            server_address=server,
+            generated_folder=GENERATED_FOLDER,
+            input_dir=config.COMFYUI_INPUT_DIR,
+            job_timeout=config.COMFYUI_JOB_TIMEOUT,
+            history_poll_interval=config.COMFYUI_HISTORY_POLL_INTERVAL,
+            residency_mode=config.COMFYUI_RESIDENCY_MODE,
+            vram_threshold=config.COMFYUI_VRAM_THRESHOLD,
+            ram_threshold=config.COMFYUI_RAM_THRESHOLD,
+            image_transfer=config.COMFYUI_IMAGE_TRANSFER,
+            output_mode=config.COMFYUI_OUTPUT_MODE,
+            embedding_cache=embedding_cache,
+            workflows=workflows,
+            retention=retention,
+            http_pool_size=config.COMFYUI_HTTP_POOL_SIZE,
+            connect_timeout=config.COMFYUI_CONNECT_TIMEOUT,
+            read_timeout=config.COMFYUI_READ_TIMEOUT,
+            http_retries=config.COMFYUI_HTTP_RETRIES,
+            http_backoff=config.COMFYUI_HTTP_BACKOFF,
+        )
+        for server in config.COMFYUI_SERVERS
+    ], health_interval=config.BACKEND_HEALTH_INTERVAL)
+
+    # Bounded in-process queue; /jobs returns immediately, /generate waits on it
+    result_cache = None
+    if config.RESULT_CACHE_ENABLED:
+        result_cache = ResultCache(config.RESULT_CACHE_FOLDER, config.RESULT_CACHE_MAX_BYTES)
+
+    jobs = JobManager(
+        backends,
+        max_queue_size=config.JOB_QUEUE_SIZE,
+        workers=config.JOB_WORKERS,
+        batch_window=config.JOB_BATCH_WINDOW,
+        max_batch_size=config.JOB_BATCH_MAX_SIZE,
+        result_cache=result_cache,
+        generated_folder=GENERATED_FOLDER,
+        workflows=workflows,
+        retention=retention,
+        thumbnails=thumbnails,
+    )
+
+def start_services():
+    """Server startup: create the folders, build the components and start the janitor."""
+    # Upload/output folders (and the ComfyUI input folder for filesystem transfer)
+    config.create_directories()
+    init_services()
+    retention.start()
+
+def create_app():
+    """The Flask app with its components started; for WSGI servers use `app:create_app()`."""
+    start_services()
+    return app
 
 @app.route('/test')
 def test():
@@ -26,8 +141,6 @@ def test():
         'config': {
             'upload_folder': UPLOAD_FOLDER,
             'generated_folder': GENERATED_FOLDER,
-            'script_path': SCRIPT_PATH,
-            'python_executable': PYTHON_EXECUTABLE,
             'comfyui_server': config.COMFYUI_HTTP,
             'comfyui_input_dir': config.COMFYUI_INPUT_DIR
         }
@@ -36,194 +149,294 @@ def test():
 @app.route('/upload', methods=['POST'])
 def upload_images():
     """Upload endpoint to handle image file uploads."""
-    print("DEBUG: Upload endpoint called")
     files = request.files.getlist('images')
-    print(f"DEBUG: Received {len(files)} files")
-    
+
     if not files or len(files) != 2:
         print("ERROR: Invalid number of files")
         return jsonify({'error': 'Please upload exactly two images.'}), 400
 
     image_paths = []
     for i, file in enumerate(files):
-        if not file.filename:
-            print(f"ERROR: File {i+1} has no filename")
-            return jsonify({'error': f'File {i+1} has no filename.'}), 400
-            
-        # Check file extension
-        file_ext = file.filename.split('.')[-1].lower() if '.' in file.filename else ''
-        if file_ext not in ['png', 'jpg', 'jpeg']:
-            print(f"ERROR: Invalid file format: {file.filename}")
-            return jsonify({'error': f'Invalid file format: {file.filename}. Only PNG, JPG, JPEG allowed.'}), 400
-        
-        # Generate unique filename
-        filename = f"{uuid.uuid4()}.{file_ext}"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        
-        # Save the file
+        file_ext, error = check_upload_filename(i, file.filename)
+        if error:
+            return jsonify({'error': error}), 400
+
+        data = file.read(config.UPLOAD_MAX_BYTES + 1)
+        if len(data) > config.UPLOAD_MAX_BYTES:
+            print(f"ERROR: File {i+1} exceeds {config.UPLOAD_MAX_BYTES} bytes")
+            return jsonify({'error': f'File {i+1} is larger than {config.UPLOAD_MAX_BYTES} bytes.'}), 413
+
+        # Store by content hash: identical uploads share one file, so the
+        # ComfyUI input name (and its node cache) stays the same
         try:
-            file.save(filepath)
+            with stage_timer('upload_save'):
+                filepath, digest, created = store_bytes(UPLOAD_FOLDER, data, file_ext)
             image_paths.append(filepath)
-            print(f"DEBUG: Saved file {i+1}: {filepath}")
         except Exception as e:
             print(f"ERROR: Failed to save file {i+1}: {e}")
             return jsonify({'error': f'Failed to save file {i+1}: {str(e)}'}), 500
 
-    print(f"DEBUG: Returning image paths: {image_paths}")
     return jsonify({'imagePaths': image_paths})
 
-@app.route('/generate', methods=['POST'])
-def generate_image():
-    """Generate endpoint to process images with ComfyUI."""
-    print("DEBUG: Generate endpoint called")
-    print(f"DEBUG: Python executable: {PYTHON_EXECUTABLE}")
-    print(f"DEBUG: Script path: {SCRIPT_PATH}")
-    
-    # Parse JSON data
-    try:
-        data = request.json
-        print(f"DEBUG: Parsed JSON data: {data}")
-    except Exception as e:
-        print(f"ERROR: Failed to parse JSON: {e}")
-        return jsonify({'error': 'Invalid JSON data'}), 400
-    
+# Request validation shared with the asyncio server (async_app.py)
+
+def check_upload_filename(i, filename):
+    """Return (extension, None) for an acceptable upload name, or (None, error message)."""
+    if not filename:
+        print(f"ERROR: File {i+1} has no filename")
+        return None, f'File {i+1} has no filename.'
+
+    # Check file extension
+    file_ext = filename.split('.')[-1].lower() if '.' in filename else ''
+    if file_ext not in ['png', 'jpg', 'jpeg']:
+        print(f"ERROR: Invalid file format: {filename}")
+        return None, f'Invalid file format: {filename}. Only PNG, JPG, JPEG allowed.'
+    return file_ext, None
+
+def validate_generation_request(data, idempotency_key=None):
+    """Validate a parsed generation request body; returns (params, None) or (None, error message)."""
+    if not isinstance(data, dict):
+        print("ERROR: Request body is not a JSON object")
+        return None, 'Invalid JSON data'
+
     # Extract required fields
     images = data.get('images')
     positive_prompt = data.get('positivePrompt')
     negative_prompt = data.get('negativePrompt')
 
-    print(f"DEBUG: Images: {images}")
-    print(f"DEBUG: Positive prompt: {positive_prompt}")
-    print(f"DEBUG: Negative prompt: {negative_prompt}")
-
     # Validate input
     if not images or len(images) != 2:
         print("ERROR: Invalid images - need exactly 2 images")
-        return jsonify({'error': 'Invalid input: need exactly 2 images.'}), 400
-        
+        return None, 'Invalid input: need exactly 2 images.'
+
     if not positive_prompt or not negative_prompt:
         print("ERROR: Missing prompts")
-        return jsonify({'error': 'Invalid input: missing prompts.'}), 400
+        return None, 'Invalid input: missing prompts.'
+
+    # Optional fixed seed: makes the request deterministic and cacheable
+    seed = data.get('seed')
+    if seed is not None:
+        if isinstance(seed, bool) or not isinstance(seed, int) or not 0 <= seed <= 0xffffffffffffffff:
+            print(f"ERROR: Invalid seed: {seed}")
+            return None, 'Invalid input: seed must be a non-negative integer.'
+
+    # Retries carrying the same key attach to the original job
+    idempotency_key = idempotency_key or data.get('idempotencyKey')
+    if idempotency_key is not None and not isinstance(idempotency_key, str):
+        print(f"ERROR: Invalid idempotency key: {idempotency_key!r}")
+        return None, 'Invalid input: idempotencyKey must be a string.'
+
+    # Optional workflow template; the registry default otherwise
+    template = data.get('template')
+    if template is not None and template not in workflows.names():
+        print(f"ERROR: Unknown workflow template: {template}")
+        return None, f'Unknown workflow template: {template}'
 
     # Check if image files exist
     for i, img_path in enumerate(images):
         if not os.path.exists(img_path):
             print(f"ERROR: Image {i+1} not found: {img_path}")
-            return jsonify({'error': f'Image {i+1} not found: {img_path}'}), 400
-
-    # Record files before generation
-    files_before = set()
-    if os.path.exists(GENERATED_FOLDER):
-        files_before = set(os.listdir(GENERATED_FOLDER))
-    print(f"DEBUG: Files in generated folder before: {files_before}")
-
-    # Clean old files automatically
-    if os.path.exists(GENERATED_FOLDER):
-        old_files = [f for f in os.listdir(GENERATED_FOLDER) if f.endswith('.png')]
-        if len(old_files) > 5:  # Keep only 5 most recent
-            old_files.sort(key=lambda x: os.path.getmtime(os.path.join(GENERATED_FOLDER, x)), reverse=True)
-            files_to_delete = old_files[5:]  # Delete all but 5 newest
-            for old_file in files_to_delete:
-                try:
-                    os.remove(os.path.join(GENERATED_FOLDER, old_file))
-                    print(f"DEBUG: 🗑️ Deleted old file: {old_file}")
-                except Exception as e:
-                    print(f"DEBUG: Failed to delete {old_file}: {e}")
-
-    # Prepare subprocess command using configured Python executable
-    cmd = [PYTHON_EXECUTABLE, SCRIPT_PATH, images[0], images[1], positive_prompt, negative_prompt]
-    print(f"DEBUG: Calling subprocess with: {cmd}")
-
-    # Call the Python script to process the images
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            timeout=300  # 5 minute timeout
-        )
-    except subprocess.TimeoutExpired:
-        print("ERROR: Subprocess timed out after 5 minutes")
-        return jsonify({'error': 'Image generation timed out'}), 500
-    except Exception as e:
-        print(f"ERROR: Subprocess failed: {e}")
-        return jsonify({'error': f'Failed to run image generation: {str(e)}'}), 500
-
-    print(f"DEBUG: Subprocess return code: {result.returncode}")
-    print(f"DEBUG: Subprocess stdout: {result.stdout}")
-    if result.stderr:
-        print(f"DEBUG: Subprocess stderr: {result.stderr}")
-
-    if result.returncode != 0:
-        print(f"ERROR: Script failed with error: {result.stderr}")
-        return jsonify({'error': f'Failed to generate image: {result.stderr}'}), 500
-
-    # Find newly generated images
-    if os.path.exists(GENERATED_FOLDER):
-        all_png_files = [f for f in os.listdir(GENERATED_FOLDER) if f.endswith('.png')]
-        
-        if all_png_files:
-            # Sort by modification time (newest first)
-            all_png_files.sort(key=lambda x: os.path.getmtime(os.path.join(GENERATED_FOLDER, x)), reverse=True)
-            
-            # Get files created in the last 30 seconds
-            fresh_files = []
-            current_time = time.time()
-            for file in all_png_files:
-                file_path = os.path.join(GENERATED_FOLDER, file)
-                file_time = os.path.getmtime(file_path)
-                time_diff = current_time - file_time
-                
-                if time_diff < 30:  # Files created in last 30 seconds
-                    fresh_files.append(file)
-                    print(f"DEBUG: Found fresh file: {file} (age: {time_diff:.1f}s)")
-            
-            if fresh_files:
-                print(f"DEBUG: ✅ Found {len(fresh_files)} fresh generated files")
-                
-                # Return all fresh generated images
-                image_paths = [f"generated/{file}" for file in fresh_files]
-                return jsonify({
-                    'generatedImagePaths': image_paths,  # Return array of all images
-                    'generatedImagePath': image_paths[0]  # Keep backward compatibility with single image
-                })
-
-    # Fallback
-    return jsonify({'error': 'No generated images found'}), 500
+            return None, f'Image {i+1} not found: {img_path}'
 
-@app.route('/generated/<filename>')
-def serve_generated(filename):
-    """Serve generated images from the generated folder."""
-    print(f"DEBUG: Serving file: {filename}")
-    
-    # Add cache-busting headers to prevent browser caching
-    response = send_from_directory(GENERATED_FOLDER, filename)
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    
-    return response
+    return {
+        'images': images,
+        'positive_prompt': positive_prompt,
+        'negative_prompt': negative_prompt,
+        'seed': seed,
+        'template': template,
+        'idempotency_key': idempotency_key,
+    }, None
 
-@app.route('/config')
-def show_config():
-    """显示当前配置"""
-    return jsonify({
+def check_variant_request(width, fmt):
+    """Resolve the raw ?w=&fmt= of /generated/<file>; returns (width, fmt, None) or (None, None, error message)."""
+    if width:
+        try:
+            width = int(width)
+        except ValueError:
+            return None, None, f'Invalid width: {width}'
+    width = width or thumbnails.default_width
+    fmt = fmt or thumbnails.default_format
+    if width not in thumbnails.widths:
+        return None, None, f'Unsupported width; use one of {list(thumbnails.widths)}'
+    if not format_supported(fmt):
+        return None, None, f'Unsupported format: {fmt}'
+    return width, fmt, None
+
+def generated_cache_control(filename):
+    if filename in MUTABLE_ALIASES:
+        # Rewritten after every job: clients revalidate with If-None-Match
+        return f'public, max-age={config.GENERATED_ALIAS_MAX_AGE}, must-revalidate'
+    # Output names are unique, so their bytes never change; a variant URL
+    # (?w=&fmt=) follows the policy of the file it was rendered from
+    return 'public, max-age=31536000, immutable'
+
+def setup_status():
+    """Body of GET /config."""
+    return {
         'status': 'running',
         'config_valid': config.validate_setup(),
         'base_dir': config.BASE_DIR,
         'upload_folder': UPLOAD_FOLDER,
         'generated_folder': GENERATED_FOLDER,
-        'python_executable': PYTHON_EXECUTABLE,
-        'script_path': SCRIPT_PATH,
         'comfyui_dir': config.COMFYUI_DIR,
         'comfyui_input_dir': config.COMFYUI_INPUT_DIR,
         'comfyui_server': config.COMFYUI_HTTP,
+        'comfyui_backends': backends.status(),
+        'embedding_cache': embedding_cache.stats() if embedding_cache else None,
+        'result_cache': result_cache.stats() if result_cache else None,
+        'retention': retention.stats(),
+    }
+
+def check_templates():
+    """Check every template against each backend's /object_info."""
+    for backend in backends.backends:
+        for name in workflows.names():
+            backend.client.check_template(workflows.get(name))
+
+def parse_generation_request():
+    """Validate a generation request body; returns (params, None) or (None, error_response)."""
+    # Parse JSON data
+    try:
+        data = request.json
+    except Exception as e:
+        print(f"ERROR: Failed to parse JSON: {e}")
+        return None, (jsonify({'error': 'Invalid JSON data'}), 400)
+
+    params, error = validate_generation_request(data, request.headers.get('Idempotency-Key'))
+    if error:
+        return None, (jsonify({'error': error}), 400)
+    return params, None
+
+def submit_generation(params):
+    """Queue a generation job; returns (job, None) or (None, error_response)."""
+    try:
+        job = jobs.submit(params)
+    except IdempotencyConflict as e:
+        return None, (jsonify({'error': str(e)}), 422)
+    if job is None:
+        return None, (jsonify({'error': 'Server is busy, please retry shortly.'}), 503)
+    return job, None
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue a generation job and return its id immediately."""
+    params, error = parse_generation_request()
+    if error:
+        return error
+
+    job, error = submit_generation(params)
+    if error:
+        return error
+
+    response = jsonify(job.to_dict())
+    response.headers['Location'] = f"/jobs/{job.id}"
+    return response, 202
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Return the status and output paths of a job."""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events')
+def stream_job(job_id):
+    """Server-sent events stream of a job's status transitions."""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def events():
+        version = None
+        while True:
+            current = job.version
+            if current != version:
+                version = current
+                yield f"event: status\ndata: {json.dumps(job.to_dict())}\n\n"
+                if job.finished:
+                    return
+            elif job.wait_for_change(version, 15) == version:
+                # Keep idle proxies from closing the stream
+                yield ": keep-alive\n\n"
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/generate', methods=['POST'])
+def generate_image():
+    """Generate endpoint to process images with ComfyUI (blocking wrapper around /jobs)."""
+    params, error = parse_generation_request()
+    if error:
+        return error
+
+    job, error = submit_generation(params)
+    if error:
+        return error
+
+    if not job.wait(config.COMFYUI_JOB_TIMEOUT + 60):
+        print(f"ERROR: Job {job.id} did not finish in time")
+        return jsonify({'error': 'Image generation timed out', 'jobId': job.id}), 500
+
+    if job.status != 'done':
+        return jsonify({'error': f'Failed to generate image: {job.error}', 'jobId': job.id}), 500
+
+    # Return exactly the files this job downloaded
+    image_paths = job.to_dict()['generatedImagePaths']
+    return jsonify({
+        'generatedImagePaths': image_paths,  # Return array of all images
+        'generatedImagePath': image_paths[0],  # Keep backward compatibility with single image
+        'seed': job.seed,  # Pass back to reproduce (and hit the result cache)
+        'cached': job.cached,
     })
 
+@app.route('/generated/<filename>')
+def serve_generated(filename):
+    """Serve generated images with content-hash ETags, conditional GET and Range support."""
+    path = safe_join(GENERATED_FOLDER, filename)
+    if path is None or not os.path.isfile(path):
+        return jsonify({'error': 'File not found'}), 404
+
+    # ?w=<width>&fmt=<webp|avif|jpeg|png> serves a resized variant instead
+    if 'w' in request.args or 'fmt' in request.args:
+        width, fmt, error = check_variant_request(request.args.get('w'), request.args.get('fmt'))
+        if error:
+            return jsonify({'error': error}), 400
+        try:
+            path = thumbnails.get(filename, width, fmt)
+        except Exception as e:
+            print(f"ERROR: Failed to render {filename} at w={width} as {fmt}: {e}")
+            return jsonify({'error': 'Failed to render image variant'}), 500
+        response = send_from_directory(GENERATED_FOLDER, os.path.basename(path), etag=file_digest(path),
+                                       conditional=True, mimetype=FORMATS[fmt][1])
+        response.headers['Cache-Control'] = generated_cache_control(filename)
+        return response
+
+    # Digests are cached per (path, size, mtime), so only changed files are re-hashed
+    response = send_from_directory(GENERATED_FOLDER, filename, etag=file_digest(path), conditional=True)
+    response.headers['Cache-Control'] = generated_cache_control(filename)
+    return response
+
+@app.route('/workflows')
+def list_workflows():
+    """Workflow templates a request can name in its `template` field."""
+    return jsonify(workflows.describe())
+
+@app.route('/metrics')
+def show_metrics():
+    """Counters, gauges and per-stage latency histograms in the Prometheus text format."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/config')
+def show_config():
+    """显示当前配置"""
+    return jsonify(setup_status())
+
 if __name__ == '__main__':
     print("🚀 启动 Flask 服务器...")
+    config.print_config()
     
     # 验证配置
     if not config.validate_setup():
@@ -232,5 +445,9 @@ if __name__ == '__main__':
         print(config.get_install_commands())
         sys.exit(1)
     
+    create_app()
+    # Check every template against each backend's /object_info up front
+    check_templates()
+
     print("✅ 配置验证通过，启动服务器...")
     app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,354 @@
+"""Asyncio serving mode: the HTTP API of app.py on aiohttp.
+
+    python async_app.py
+
+serves the same routes as `python app.py` on the same port, backed by the
+same job manager, backend pool, caches and janitor. A pending /generate or
+SSE stream is a coroutine waiting on a job-change callback rather than a
+blocked thread, so one process can hold hundreds of them; JOB_QUEUE_SIZE
+still bounds how many jobs are accepted.
+
+Nothing blocking runs on the event loop: ComfyUI calls (HTTP and the
+websocket listener) stay on the job worker threads, and file I/O, hashing
+and request validation go to a small executor.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from werkzeug.utils import safe_join
+
+from config import config
+from content_store import store_bytes
+from job_queue import IdempotencyConflict
+import metrics
+from metrics import stage_timer
+from thumbnails import FORMATS
+import app as services
+from app import (
+    GENERATED_FOLDER,
+    UPLOAD_FOLDER,
+    check_templates,
+    check_upload_filename,
+    check_variant_request,
+    generated_cache_control,
+    setup_status,
+    validate_generation_request,
+)
+
+# Disk work (uploads, digests, stat calls, cache hits) off the event loop
+io_executor = ThreadPoolExecutor(max_workers=config.ASYNC_IO_WORKERS, thread_name_prefix='async-io')
+
+
+async def run_blocking(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(io_executor, func, *args)
+
+
+async def wait_for_change(job, seen_version, timeout):
+    """Wait until the job changes past `seen_version`; returns the current version."""
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def notify(_):
+        loop.call_soon_threadsafe(changed.set)
+
+    job.subscribe(notify)
+    try:
+        if job.version == seen_version:
+            await asyncio.wait_for(changed.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        job.unsubscribe(notify)
+    return job.version
+
+
+async def wait_for_job(job, timeout):
+    """Wait until the job reaches a terminal status; returns False on timeout."""
+    deadline = time.monotonic() + timeout
+    version = job.version
+    while not job.finished:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        version = await wait_for_change(job, version, remaining)
+    return True
+
+
+def error_response(message, status):
+    return web.json_response({'error': message}, status=status)
+
+
+# CORS for all routes, like flask_cors.CORS(app)
+
+@web.middleware
+async def cors_preflight(request, handler):
+    if request.method == 'OPTIONS' and 'Access-Control-Request-Method' in request.headers:
+        return web.Response(headers={
+            'Access-Control-Allow-Methods': 'GET, HEAD, POST, OPTIONS',
+            'Access-Control-Allow-Headers': request.headers.get('Access-Control-Request-Headers', ''),
+        })
+    return await handler(request)
+
+
+async def allow_any_origin(request, response):
+    # A response_prepare hook, so streamed and error responses get it too
+    response.headers['Access-Control-Allow-Origin'] = '*'
+
+
+async def test(request):
+    return web.json_response({
+        'message': 'aiohttp server is working with auto-config!',
+        'config': {
+            'upload_folder': UPLOAD_FOLDER,
+            'generated_folder': GENERATED_FOLDER,
+            'comfyui_server': config.COMFYUI_HTTP,
+            'comfyui_input_dir': config.COMFYUI_INPUT_DIR,
+        },
+    })
+
+
+async def read_part(part, limit):
+    """Read one multipart file, refusing more than `limit` bytes."""
+    chunks = []
+    size = 0
+    while True:
+        chunk = await part.read_chunk()
+        if not chunk:
+            return b''.join(chunks)
+        size += len(chunk)
+        if size > limit:
+            raise web.HTTPRequestEntityTooLarge(max_size=limit, actual_size=size)
+        chunks.append(chunk)
+
+
+async def upload_images(request):
+    """Upload endpoint to handle image file uploads."""
+    try:
+        reader = await request.multipart()
+    except (AssertionError, ValueError, KeyError):
+        # Not a multipart body
+        return error_response('Please upload exactly two images.', 400)
+
+    uploads = []
+    async for part in reader:
+        if part.name != 'images':
+            continue
+        if len(uploads) == 2:
+            return error_response('Please upload exactly two images.', 400)
+        uploads.append((part.filename, await read_part(part, config.UPLOAD_MAX_BYTES)))
+    if len(uploads) != 2:
+        print("ERROR: Invalid number of files")
+        return error_response('Please upload exactly two images.', 400)
+
+    image_paths = []
+    for i, (filename, data) in enumerate(uploads):
+        file_ext, error = check_upload_filename(i, filename)
+        if error:
+            return error_response(error, 400)
+        try:
+            with stage_timer('upload_save'):
+                filepath, digest, created = await run_blocking(store_bytes, UPLOAD_FOLDER, data, file_ext)
+        except Exception as e:
+            print(f"ERROR: Failed to save file {i+1}: {e}")
+            return error_response(f'Failed to save file {i+1}: {str(e)}', 500)
+        image_paths.append(filepath)
+    return web.json_response({'imagePaths': image_paths})
+
+
+async def parse_generation_request(request):
+    """Validate a generation request body; returns (params, None) or (None, error_response)."""
+    try:
+        data = await request.json()
+    except ValueError as e:
+        print(f"ERROR: Failed to parse JSON: {e}")
+        return None, error_response('Invalid JSON data', 400)
+
+    # Checks image paths and may reload templates from disk
+    params, error = await run_blocking(validate_generation_request, data, request.headers.get('Idempotency-Key'))
+    if error:
+        return None, error_response(error, 400)
+    return params, None
+
+
+async def submit_generation(params):
+    """Queue a generation job; returns (job, None) or (None, error_response)."""
+    # Hashes the reference images and may materialize a cached result
+    try:
+        job = await run_blocking(services.jobs.submit, params)
+    except IdempotencyConflict as e:
+        return None, error_response(str(e), 422)
+    if job is None:
+        return None, error_response('Server is busy, please retry shortly.', 503)
+    return job, None
+
+
+async def create_job(request):
+    """Queue a generation job and return its id immediately."""
+    params, error = await parse_generation_request(request)
+    if error:
+        return error
+    job, error = await submit_generation(params)
+    if error:
+        return error
+    return web.json_response(job.to_dict(), status=202, headers={'Location': f"/jobs/{job.id}"})
+
+
+async def get_job(request):
+    """Return the status and output paths of a job."""
+    job = services.jobs.get(request.match_info['job_id'])
+    if job is None:
+        return error_response('Job not found', 404)
+    return web.json_response(job.to_dict())
+
+
+async def stream_job(request):
+    """Server-sent events stream of a job's status transitions."""
+    job = services.jobs.get(request.match_info['job_id'])
+    if job is None:
+        return error_response('Job not found', 404)
+
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    await response.prepare(request)
+    version = None
+    while True:
+        current = job.version
+        if current != version:
+            version = current
+            await response.write(f"event: status\ndata: {json.dumps(job.to_dict())}\n\n".encode())
+            if job.finished:
+                break
+        elif await wait_for_change(job, version, 15) == version:
+            # Keep idle proxies from closing the stream
+            await response.write(b": keep-alive\n\n")
+    await response.write_eof()
+    return response
+
+
+async def generate_image(request):
+    """Generate endpoint (blocking wrapper around /jobs, without blocking a thread)."""
+    params, error = await parse_generation_request(request)
+    if error:
+        return error
+    job, error = await submit_generation(params)
+    if error:
+        return error
+
+    if not await wait_for_job(job, config.COMFYUI_JOB_TIMEOUT + 60):
+        print(f"ERROR: Job {job.id} did not finish in time")
+        return web.json_response({'error': 'Image generation timed out', 'jobId': job.id}, status=500)
+
+    if job.status != 'done':
+        return web.json_response({'error': f'Failed to generate image: {job.error}', 'jobId': job.id}, status=500)
+
+    image_paths = job.to_dict()['generatedImagePaths']
+    return web.json_response({
+        'generatedImagePaths': image_paths,
+        'generatedImagePath': image_paths[0],
+        'seed': job.seed,
+        'cached': job.cached,
+    })
+
+
+def resolve_generated(filename):
+    path = safe_join(GENERATED_FOLDER, filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    return path
+
+
+async def render_variant(filename, width, fmt):
+    """Path of a resized variant, awaiting the shared render if needed."""
+    future = await run_blocking(services.thumbnails.submit, filename, width, fmt)
+    if future is not None:
+        # Shielded: other requests may be waiting on the same render
+        await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), 30)
+    return await run_blocking(services.thumbnails.variant_path, filename, width, fmt)
+
+
+async def serve_generated(request):
+    """Serve generated images with conditional GET and Range support."""
+    filename = request.match_info['filename']
+    path = await run_blocking(resolve_generated, filename)
+    if path is None:
+        return error_response('File not found', 404)
+
+    headers = {'Cache-Control': generated_cache_control(filename)}
+    query = request.query
+    if 'w' in query or 'fmt' in query:
+        width, fmt, error = check_variant_request(query.get('w'), query.get('fmt'))
+        if error:
+            return error_response(error, 400)
+        try:
+            path = await render_variant(filename, width, fmt)
+        except Exception as e:
+            print(f"ERROR: Failed to render {filename} at w={width} as {fmt}: {e}")
+            return error_response('Failed to render image variant', 500)
+        headers['Content-Type'] = FORMATS[fmt][1]
+
+    # aiohttp streams the file from a thread and validates with mtime/size
+    # ETags, so no request hashes a file on the event loop
+    return web.FileResponse(path, headers=headers)
+
+
+async def list_workflows(request):
+    """Workflow templates a request can name in its `template` field."""
+    return web.json_response(await run_blocking(services.workflows.describe))
+
+
+async def show_metrics(request):
+    """Counters, gauges and per-stage latency histograms in the Prometheus text format."""
+    return web.Response(body=metrics.render().encode(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+async def show_config(request):
+    return web.json_response(await run_blocking(setup_status))
+
+
+def create_app():
+    # Folders, caches, backend pool, job manager and janitor, shared with app.py
+    services.start_services()
+    app = web.Application(middlewares=[cors_preflight])
+    app.on_response_prepare.append(allow_any_origin)
+    app.add_routes([
+        web.get('/test', test),
+        web.post('/upload', upload_images),
+        web.post('/jobs', create_job),
+        web.get('/jobs/{job_id}', get_job),
+        web.get('/jobs/{job_id}/events', stream_job),
+        web.post('/generate', generate_image),
+        web.get('/generated/{filename}', serve_generated),
+        web.get('/workflows', list_workflows),
+        web.get('/metrics', show_metrics),
+        web.get('/config', show_config),
+    ])
+    return app
+
+
+def main():
+    print("🚀 启动 aiohttp 服务器...")
+    config.print_config()
+    if not config.validate_setup():
+        print("❌ 配置验证失败，请检查配置!")
+        print("\n📋 建议运行以下命令:")
+        print(config.get_install_commands())
+        sys.exit(1)
+
+    app = create_app()
+    # Check every template against each backend's /object_info up front
+    check_templates()
+
+    print("✅ 配置验证通过，启动服务器...")
+    web.run_app(app, host='0.0.0.0', port=5000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""Pool of ComfyUI backends with least-loaded scheduling.
+
+Each backend gets its own ComfyUIClient (websocket listener, residency
+policy, staged-image cache). A background thread health-checks every backend
+through /queue and /system_stats; new jobs go to the healthy backend with the
+shortest queue, ties broken by free VRAM. Jobs that fail before they started
+on a backend are retried on another one.
+"""
+import threading
+import time
+
+from metrics import BACKEND_HEALTHY, BACKEND_QUEUE_DEPTH
+
+
+class Backend:
+    """One ComfyUI server plus the load figures the scheduler ranks it by."""
+
+    def __init__(self, client):
+        self.client = client
+        self.address = client.server_address
+        self.healthy = True  # optimistic until the first check says otherwise
+        self.queue_depth = 0
+        self.vram_free_fraction = 0.0
+        self.active_jobs = 0
+        self.last_checked = None
+        self.last_error = None
+
+    def refresh(self):
+        """Update health, queue depth and free VRAM from the server."""
+        try:
+            # No retries: the next check comes soon enough
+            queue_response = self.client.http.get("/queue", timeout=5, retries=0)
+            queue_response.raise_for_status()
+            queue = queue_response.json()
+            self.queue_depth = len(queue.get('queue_running', [])) + len(queue.get('queue_pending', []))
+
+            stats_response = self.client.http.get("/system_stats", timeout=5, retries=0)
+            stats_response.raise_for_status()
+            self.vram_free_fraction = self.free_vram_fraction(stats_response.json())
+
+            if not self.healthy:
+                print(f"[POOL] Backend {self.address} is healthy again")
+            self.healthy = True
+            self.last_error = None
+        except Exception as e:
+            if self.healthy:
+                print(f"[POOL] Backend {self.address} marked unhealthy: {e}")
+            self.healthy = False
+            self.last_error = str(e)
+        self.last_checked = time.time()
+        BACKEND_QUEUE_DEPTH.set(self.queue_depth, backend=self.address)
+        BACKEND_HEALTHY.set(1 if self.healthy else 0, backend=self.address)
+        return self.healthy
+
+    @staticmethod
+    def free_vram_fraction(stats):
+        fractions = []
+        for device in stats.get('devices', []):
+            total = device.get('vram_total') or 0
+            if total:
+                fractions.append((device.get('vram_free') or 0) / total)
+        return max(fractions) if fractions else 0.0
+
+    def load(self):
+        """Sort key: fewer queued prompts first, then more free VRAM."""
+        # Jobs we handed out since the last refresh are not in queue_depth yet
+        return (max(self.queue_depth, self.active_jobs), -self.vram_free_fraction)
+
+    def status(self):
+        return {
+            'server': self.address,
+            'healthy': self.healthy,
+            'queue_depth': self.queue_depth,
+            'active_jobs': self.active_jobs,
+            'vram_free_fraction': round(self.vram_free_fraction, 3),
+            'last_checked': self.last_checked,
+            'last_error': self.last_error,
+        }
+
+
+class BackendPool:
+    """Schedules generation jobs onto the least-loaded healthy backend."""
+
+    def __init__(self, clients, health_interval=10):
+        if not clients:
+            raise ValueError("BackendPool needs at least one ComfyUI client")
+        self.backends = [Backend(client) for client in clients]
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start the background health checker (idempotent)."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._health_loop, name="backend-health", daemon=True)
+            self._thread.start()
+
+    def refresh(self):
+        for backend in self.backends:
+            backend.refresh()
+
+    def _health_loop(self):
+        while True:
+            self.refresh()
+            time.sleep(self.health_interval)
+
+    def choose(self, exclude=()):
+        """Pick the least-loaded healthy backend and reserve a slot on it; None if none is available."""
+        self.start()
+        with self._lock:
+            candidates = [b for b in self.backends if b.healthy and b not in exclude]
+            if not candidates:
+                return None
+            backend = min(candidates, key=Backend.load)
+            backend.active_jobs += 1
+            return backend
+
+    def release(self, backend):
+        with self._lock:
+            backend.active_jobs -= 1
+
+    def status(self):
+        return [backend.status() for backend in self.backends]
+
+    def generate(self, image1_path, image2_path, positive_prompt, negative_prompt, seed=None, template=None,
+                 job_id=None):
+        """Run the workflow on the best backend, failing over while the job has not started anywhere."""
+        tried = []
+        result = None
+        while len(tried) < len(self.backends):
+            backend = self.choose(exclude=tried)
+            if backend is None:
+                break
+            tried.append(backend)
+
+            try:
+                result = backend.client.generate(image1_path, image2_path, positive_prompt, negative_prompt, seed,
+                                                 template, job_id)
+            finally:
+                self.release(backend)
+
+            result['backend'] = backend.address
+            if result['success'] or not result.get('retryable'):
+                return result
+
+            # The job never started there: take the backend out and try the next one
+            print(f"[POOL] {backend.address} failed before starting the job: {result['error']}")
+            backend.healthy = False
+            backend.last_error = result['error']
+
+        if result is None:
+            return self.no_backend_result()
+        return result
+
+    def generate_batch(self, batch, on_result=None):
+        """Run a micro-batch on the best backend; requests that failed before starting move to the next one.
+
+        `on_result(index, result)` is called once per request as soon as its
+        result is final, as by ComfyUIClient.generate_batch().
+        """
+        results = [None] * len(batch)
+        remaining = list(range(len(batch)))
+        tried = []
+        while remaining and len(tried) < len(self.backends):
+            backend = self.choose(exclude=tried)
+            if backend is None:
+                break
+            tried.append(backend)
+
+            def report(position, result, backend=backend, indices=remaining):
+                # Retryable failures are reported once no backend is left to retry them on
+                result['backend'] = backend.address
+                if on_result is not None and (result['success'] or not result.get('retryable')):
+                    on_result(indices[position], result)
+
+            try:
+                batch_results = backend.client.generate_batch([batch[i] for i in remaining], on_result=report)
+            finally:
+                self.release(backend)
+
+            retry = []
+            for i, result in zip(remaining, batch_results):
+                result['backend'] = backend.address
+                results[i] = result
+                if not result['success'] and result.get('retryable'):
+                    retry.append(i)
+            if retry:
+                print(f"[POOL] {backend.address} failed before starting {len(retry)} jobs: {results[retry[0]]['error']}")
+                backend.healthy = False
+                backend.last_error = results[retry[0]]['error']
+            remaining = retry
+
+        results = [result or self.no_backend_result() for result in results]
+        if on_result is not None:
+            for i in remaining:
+                on_result(i, results[i])
+        return results
+
+    @staticmethod
+    def no_backend_result():
+        return {
+            'success': False,
+            'error': 'No healthy ComfyUI backend available.',
+            'retryable': True,
+            'prompt_id': None,
+            'client_id': None,
+            'prefix': None,
+            'seed': None,
+            'images': [],
+            'backend': None,
+        }
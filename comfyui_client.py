@@ -0,0 +1,939 @@
+"""Importable ComfyUI client for the IP-Adapter workflow.
+
+Used in-process by the Flask app; `websocket_api_ws_images.py` is a thin CLI
+wrapper around it.
+"""
+import io
+import uuid
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from PIL import Image
+
+from comfyui_events import ComfyUIEventListener
+from comfyui_http import ComfyUIHttp
+from content_store import atomic_write, file_digest, replace_with_link
+from micro_batch import batch_key, merge_workflows
+from embedding_cache import (
+    ENCODER_SLOTS,
+    add_embedding_savers,
+    apply_cached_embeddings,
+    comfyui_name as comfyui_embeds_name,
+    plan_embeddings,
+    saved_output_name as saved_embeds_name,
+    supports_workflow as supports_embedding_cache,
+)
+from graph_optimizer import OUTPUT_NODE_CLASSES, describe_report, optimize_workflow, output_classes_from_object_info
+from metrics import STAGE_FAILURES, stage_timer
+from model_residency import ModelResidencyPolicy
+from workflow_registry import WorkflowRegistry
+
+# 导入配置
+try:
+    from config import config
+    BASE_DIR = config.BASE_DIR
+    DEFAULT_SERVER_ADDRESS = config.COMFYUI_SERVER
+    DEFAULT_GENERATED_FOLDER = config.GENERATED_FOLDER
+    DEFAULT_INPUT_DIR = config.COMFYUI_INPUT_DIR
+    DEFAULT_WORKFLOWS_FOLDER = config.WORKFLOWS_FOLDER
+except ImportError:
+    print("[WARNING] Config file not found, using default settings")
+    config = None
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    DEFAULT_SERVER_ADDRESS = "127.0.0.1:8188"
+    DEFAULT_GENERATED_FOLDER = os.path.join(BASE_DIR, 'generated')
+    DEFAULT_INPUT_DIR = None
+    DEFAULT_WORKFLOWS_FOLDER = os.path.join(BASE_DIR, 'workflows')
+
+# Fixed name kept pointing at the newest output for older clients
+LATEST_IMAGE_NAME = 'latest_image.png'
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# Reference images in these formats are staged byte for byte when already RGB
+PASSTHROUGH_FORMATS = {'PNG': ('png', 'image/png'), 'JPEG': ('jpg', 'image/jpeg')}
+EXIF_ORIENTATION = 0x0112
+
+
+def encode_reference_image(image_path):
+    """Return (bytes, extension, mimetype) of a reference image in a form LoadImage accepts.
+
+    RGB PNG/JPEG files without an EXIF rotation are used as they are; anything
+    else is converted to RGB and encoded as a quickly compressed PNG.
+    """
+    with Image.open(image_path) as img:
+        passthrough = PASSTHROUGH_FORMATS.get(img.format)
+        if passthrough and img.mode == 'RGB' and img.getexif().get(EXIF_ORIENTATION, 1) == 1:
+            with open(image_path, 'rb') as f:
+                return (f.read(),) + passthrough
+        # 使用 Pillow 保证格式兼容 ComfyUI，转换为 RGB 并编码为 PNG
+        buffer = io.BytesIO()
+        img.convert("RGB").save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue(), 'png', 'image/png'
+
+# ─── CLIENT ────────────────────────────────────────────────────────────────────
+
+class ComfyUIClient:
+    """Runs workflow templates against one ComfyUI server and returns structured results."""
+
+    def __init__(self, server_address=None, generated_folder=None, input_dir=None,
+                 job_timeout=300, history_poll_interval=5, residency_mode='auto',
+                 vram_threshold=0.90, ram_threshold=0.90, image_transfer='upload',
+                 output_mode='history', embedding_cache=None, workflows=None, retention=None,
+                 http_pool_size=8, connect_timeout=3.05, read_timeout=30, http_retries=2, http_backoff=0.5,
+                 staging_workers=4, download_workers=4):
+        self.server_address = server_address or DEFAULT_SERVER_ADDRESS
+        self.http_server = f"http://{self.server_address}"
+        # Keep-alive connection pool shared by every HTTP call to this backend
+        self.http = ComfyUIHttp(
+            self.http_server,
+            pool_size=http_pool_size,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            retries=http_retries,
+            backoff=http_backoff,
+        )
+        self.generated_folder = generated_folder or DEFAULT_GENERATED_FOLDER
+        self.configured_input_dir = input_dir if input_dir is not None else DEFAULT_INPUT_DIR
+        self.job_timeout = job_timeout
+        self.history_poll_interval = history_poll_interval
+        # Give up on a prompt once its backend has been unreachable this long
+        self.backend_lost_after = 20
+        # How long a connected websocket may lag /history with the end of a
+        # prompt whose outputs arrive as frames before we stop waiting for them
+        self.frame_grace = 10
+        # 'upload' sends reference images over HTTP; 'filesystem' writes them
+        # into COMFYUI_INPUT_DIR when Flask and ComfyUI share a host
+        self.image_transfer = image_transfer
+        self._input_dir = None
+
+        # content digest -> name already staged on this backend
+        self._staged = {}
+        self._staged_lock = threading.Lock()
+        # Reference images of a job (or micro-batch) are staged concurrently
+        self._staging = ThreadPoolExecutor(max_workers=staging_workers, thread_name_prefix='staging')
+        # Outputs are downloaded concurrently, streamed to disk in chunks
+        self._downloads = ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix='downloads')
+
+        # Shared RetentionManager: outputs go to its 'generated' area, staged
+        # inputs (filesystem transfer) to 'comfyui_input'
+        self.retention = retention
+        if retention is not None:
+            retention.on_evict('comfyui_input', self.forget_staged)
+
+        # One persistent websocket per client; every prompt is queued under its client_id
+        self.events = ComfyUIEventListener(self.server_address)
+
+        # 'history' saves outputs on the ComfyUI host and downloads them via
+        # /view; 'websocket' streams them back as binary frames instead
+        self.output_mode = output_mode
+
+        # Workflow templates (shared registry) and their validation against
+        # this backend's /object_info, fetched once
+        self.workflows = workflows or WorkflowRegistry(DEFAULT_WORKFLOWS_FOLDER)
+        self._object_info = None
+        self._output_classes = OUTPUT_NODE_CLASSES
+        self._template_problems = {}
+
+        # Shared EmbeddingCache of IP-Adapter reference embeddings (optional)
+        self.embedding_cache = embedding_cache
+
+        # Models stay warm across jobs unless the backend runs short on memory
+        self.residency = ModelResidencyPolicy(
+            self.http,
+            mode=residency_mode,
+            vram_threshold=vram_threshold,
+            ram_threshold=ram_threshold,
+        )
+
+    def find_comfyui_input_dir(self):
+        """Find the correct ComfyUI input directory (resolved once per client)."""
+        if self._input_dir:
+            return self._input_dir
+
+        # Use configured path if available
+        if self.configured_input_dir and os.path.exists(self.configured_input_dir):
+            print(f"[SUCCESS] Using configured ComfyUI input directory: {self.configured_input_dir}")
+            self._input_dir = self.configured_input_dir
+            return self._input_dir
+
+        # Fallback path search
+        possible_input_dirs = [
+            r"C:\3daiagent\Tools\ComfyUI\input",
+            os.path.join(os.path.dirname(BASE_DIR), "ComfyUI", "input"),
+            os.path.join(os.path.dirname(BASE_DIR), "Tools", "ComfyUI", "input"),
+            r"C:\ComfyUI\input",
+            os.path.join(os.path.expanduser("~"), "ComfyUI", "input"),
+            os.path.join(BASE_DIR, "input"),
+        ]
+
+        for input_dir in possible_input_dirs:
+            if os.path.exists(input_dir):
+                print(f"[SUCCESS] Found ComfyUI input directory: {input_dir}")
+                self._input_dir = input_dir
+                return self._input_dir
+
+        fallback = os.path.join(BASE_DIR, "input")
+        os.makedirs(fallback, exist_ok=True)
+        print(f"[WARNING] Created fallback input directory: {fallback}")
+        self._input_dir = fallback
+        return self._input_dir
+
+    def test_comfyui_connection(self):
+        """Test if ComfyUI server is running and accessible."""
+        try:
+            response = self.http.get("/", timeout=5)
+            if response.status_code == 200:
+                return True
+            else:
+                print(f"[ERROR] ComfyUI server returned status code {response.status_code}")
+                return False
+        except Exception as e:
+            print(f"[ERROR] Failed to connect to ComfyUI server: {e}")
+            return False
+
+    def clear_comfyui_queue(self):
+        """Clear ComfyUI's queue and interrupt current execution."""
+        try:
+            print("[QUEUE] Clearing ComfyUI queue...")
+
+            # Interrupt current execution
+            interrupt_response = self.http.post("/interrupt", timeout=5)
+            if interrupt_response.status_code == 200:
+                print("[QUEUE] Interrupted current execution")
+
+            # Clear the queue
+            queue_response = self.http.post("/queue", json={"clear": True}, timeout=5)
+            if queue_response.status_code == 200:
+                print("[QUEUE] Cleared queue")
+
+            time.sleep(1)
+            return True
+
+        except Exception as e:
+            print(f"[QUEUE] Queue clear failed: {e}")
+            return False
+
+    def clear_comfyui_cache(self):
+        """Clear ComfyUI's queue and unload all models (manual recovery only; not used per job)."""
+        try:
+            print("[CACHE] Clearing ComfyUI cache...")
+
+            # Clear queue first
+            self.clear_comfyui_queue()
+
+            # Try to clear model cache
+            response = self.http.post("/free", json={"unload_models": True}, timeout=5)
+            if response.status_code == 200:
+                print("[CACHE] Model cache cleared")
+            else:
+                print(f"[CACHE] Model cache clear failed: {response.status_code}")
+
+            time.sleep(2)
+            return True
+        except Exception as e:
+            print(f"[CACHE] Cache clear failed: {e}")
+            return False
+
+    def prepare_image_for_comfyui(self, image_path):
+        """Stage a reference image for ComfyUI and return the name to put in a LoadImage node.
+
+        Names are derived from the image's content hash and each name is staged
+        once per backend, so identical references give LoadImage the same input
+        and ComfyUI's node cache can skip the CLIP vision encoding.
+        """
+        try:
+            digest = file_digest(image_path)
+        except OSError as e:
+            print(f"[ERROR] Cannot read image {image_path}: {e}")
+            return None
+
+        with self._staged_lock:
+            staged_name = self._staged.get(digest)
+        if staged_name:
+            self.touch_staged(staged_name)
+            return staged_name
+
+        try:
+            data, ext, content_type = encode_reference_image(image_path)
+        except Exception as e:
+            print(f"[ERROR] Error encoding image for ComfyUI: {e}")
+            return None
+        content_filename = f"ref_{digest}.{ext}"
+
+        if self.image_transfer == 'upload':
+            staged_name = self.upload_file_to_comfyui(content_filename, data, content_type)
+        else:
+            staged_name = self.write_input_file(content_filename, data)
+
+        if staged_name:
+            with self._staged_lock:
+                self._staged[digest] = staged_name
+            self.touch_staged(staged_name)
+        return staged_name
+
+    def prepare_images_for_comfyui(self, image_paths):
+        """Stage several reference images concurrently; returns their names (None where staging failed)."""
+        unique_paths = list(dict.fromkeys(image_paths))
+        with stage_timer('staging'):
+            names = dict(zip(unique_paths, self._staging.map(self.prepare_image_for_comfyui, unique_paths)))
+        if not all(names.values()):
+            STAGE_FAILURES.inc(stage='staging')
+        return [names[path] for path in image_paths]
+
+    def touch_staged(self, name):
+        """Tell the janitor a staged input is in use (filesystem transfer only)."""
+        if self.retention is not None and self.image_transfer == 'filesystem':
+            self.retention.touch('comfyui_input', os.path.join(self.find_comfyui_input_dir(), name))
+
+    def forget_staged(self, path):
+        """Eviction callback: a staged input was deleted, so stage it again when next needed."""
+        name = os.path.basename(path)
+        with self._staged_lock:
+            for key in [key for key, staged_name in self._staged.items() if staged_name == name]:
+                del self._staged[key]
+
+    def track_output(self, path):
+        if self.retention is not None:
+            self.retention.track('generated', path)
+
+    def upload_file_to_comfyui(self, filename, data, content_type):
+        """POST raw bytes to /upload/image and return the name ComfyUI nodes should reference."""
+        try:
+            response = self.http.post(
+                "/upload/image",
+                files={'image': (filename, data, content_type)},
+                data={'type': 'input', 'overwrite': 'true'},
+            )
+            if response.status_code != 200:
+                print(f"[ERROR] Upload of {filename} failed: {response.status_code} {response.text}")
+                return None
+
+            # ComfyUI may rename the file; LoadImage expects "<subfolder>/<name>"
+            uploaded = response.json()
+            name = uploaded.get('name', filename)
+            if uploaded.get('subfolder'):
+                name = f"{uploaded['subfolder']}/{name}"
+            return name
+        except Exception as e:
+            print(f"[ERROR] Error uploading to ComfyUI: {e}")
+            return None
+
+    def stage_embedding(self, key):
+        """Make a cached embedding available to IPAdapterLoadEmbeds on this backend."""
+        staged_key = f"embeds:{key}"
+        with self._staged_lock:
+            staged_name = self._staged.get(staged_key)
+        if staged_name:
+            self.touch_staged(staged_name)
+            return staged_name
+
+        filename = comfyui_embeds_name(key)
+        try:
+            data = self.embedding_cache.read(key)
+            if self.image_transfer == 'upload':
+                staged_name = self.upload_file_to_comfyui(filename, data, 'application/octet-stream')
+            else:
+                staged_name = self.write_input_file(filename, data)
+        except Exception as e:
+            print(f"[EMBEDS] Failed to stage embedding {key}: {e}")
+            return None
+
+        if staged_name:
+            with self._staged_lock:
+                self._staged[staged_key] = staged_name
+            self.touch_staged(staged_name)
+        return staged_name
+
+    def apply_embedding_cache(self, workflow, image_paths):
+        """Swap cached reference embeddings into the workflow; returns the keys to collect after the job."""
+        if not self.embedding_cache or not supports_embedding_cache(workflow):
+            return []
+
+        try:
+            digests = [file_digest(path) for path in image_paths]
+        except OSError as e:
+            print(f"[EMBEDS] Cannot hash reference images: {e}")
+            return []
+
+        hits, misses, negative = plan_embeddings(self.embedding_cache, workflow, digests)
+
+        staged_names = {}
+        for index, key in list(hits.items()):
+            name = self.stage_embedding(key)
+            if name:
+                staged_names[key] = name
+            else:
+                misses[index] = hits.pop(index)
+
+        neg_key, neg_cached = negative
+        if neg_cached and len(hits) == len(ENCODER_SLOTS):
+            name = self.stage_embedding(neg_key)
+            if name:
+                staged_names[neg_key] = name
+            else:
+                negative = (neg_key, False)
+
+        apply_cached_embeddings(workflow, hits, negative, staged_names)
+        return add_embedding_savers(workflow, misses, negative)
+
+    def collect_embeddings(self, pending):
+        """Fetch the .ipadpt files saved by IPAdapterSaveEmbeds into the local cache."""
+        for key in pending:
+            filename = saved_embeds_name(key)
+            try:
+                response = self.http.get(
+                    "/view",
+                    params={'filename': filename, 'subfolder': '', 'type': 'output'},
+                )
+                if response.status_code != 200:
+                    print(f"[EMBEDS] Could not fetch {filename}: {response.status_code}")
+                    continue
+                self.embedding_cache.put(key, response.content)
+            except Exception as e:
+                print(f"[EMBEDS] Failed to fetch {filename}: {e}")
+
+    def write_input_file(self, filename, data):
+        """Write `data` into the ComfyUI input directory (shared-host mode); returns the name or None.
+
+        The file is written under a temporary name and renamed into place, so
+        ComfyUI never reads a partial file.
+        """
+        dst_path = os.path.join(self.find_comfyui_input_dir(), filename)
+        if os.path.exists(dst_path):
+            # Content-addressed name: an existing file already has these bytes
+            return filename
+
+        try:
+            atomic_write(dst_path, data)
+        except OSError as e:
+            print(f"[ERROR] Error saving {filename} for ComfyUI: {e}")
+            return None
+        return filename
+
+    def get_object_info(self):
+        """Node definitions of this backend, fetched on first use."""
+        if self._object_info is None:
+            response = self.http.get("/object_info")
+            response.raise_for_status()
+            self._object_info = response.json()
+            self._output_classes = output_classes_from_object_info(self._object_info) or OUTPUT_NODE_CLASSES
+        return self._object_info
+
+    def check_template(self, template):
+        """Validate a template against this backend once; returns the list of problems."""
+        problems = self._template_problems.get(template.hash)
+        if problems is None:
+            try:
+                problems = template.validate(self.get_object_info())
+            except Exception as e:
+                # Try again next time; ComfyUI still validates the prompt on submission
+                print(f"[WORKFLOWS] Cannot validate {template.name} on {self.server_address}: {e}")
+                return []
+            for problem in problems:
+                print(f"[WORKFLOWS] {template.name} on {self.server_address}: {problem}")
+            self._template_problems[template.hash] = problems
+        return problems
+
+    def resolve_template(self, name):
+        """Return (template, error) for a template name (None for the default)."""
+        try:
+            template = self.workflows.get(name)
+        except KeyError as e:
+            return None, str(e)
+        problems = self.check_template(template)
+        if problems:
+            return None, f"Workflow template '{template.name}' is not supported by {self.server_address}: {problems[0]}"
+        return template, None
+
+    def load_and_update_workflow(self, image1_path, image2_path, positive_prompt, negative_prompt, seed=None,
+                                 template=None, job_id=None):
+        """Build a workflow from the template (default if None) with new images, prompts and seed (random if None).
+
+        The SaveImage prefix carries `job_id`, so every output file of the job is tagged with it.
+        """
+        template = template or self.workflows.get()
+
+        if not os.path.exists(image1_path):
+            print(f"[ERROR] Image 1 not found: {image1_path}")
+            return None
+        if not os.path.exists(image2_path):
+            print(f"[ERROR] Image 2 not found: {image2_path}")
+            return None
+
+        image1_filename, image2_filename = self.prepare_images_for_comfyui([image1_path, image2_path])
+
+        if not image1_filename or not image2_filename:
+            print("[ERROR] Failed to prepare images for ComfyUI")
+            return None
+
+        # Unique per job: concurrent workers may submit within the same second
+        unique_prefix = f"IPAdapter_{job_id or uuid.uuid4().hex}"
+        workflow = template.instantiate({
+            'image_a': image1_filename,
+            'image_b': image2_filename,
+            'positive': positive_prompt,
+            'negative': negative_prompt,
+            'seed': random.randint(1, 1000000000) if seed is None else int(seed),
+            'prefix': unique_prefix,
+        })
+
+        return workflow
+
+    def send_workflow_http(self, workflow):
+        """Send the workflow using the HTTP API."""
+        try:
+            # Drop nodes that feed no output and merge duplicates left by rewrites
+            workflow, report = optimize_workflow(workflow, self._output_classes)
+            summary = describe_report(report)
+            if summary:
+                print(f"[OPTIMIZE] {summary}")
+
+            # Keep models resident unless memory is tight or the checkpoint changed
+            self.residency.before_submit(workflow)
+
+            # Queue under the listener's client_id so its websocket receives our events
+            client_id = self.events.client_id
+
+            payload = {
+                "prompt": workflow,
+                "client_id": client_id
+            }
+
+            with stage_timer('submit'):
+                response = self.http.post("/prompt", json=payload)
+
+            if response.status_code == 200:
+                result = response.json()
+                prompt_id = result.get('prompt_id')
+                return client_id, prompt_id
+            else:
+                STAGE_FAILURES.inc(stage='submit')
+                print(f"[ERROR] Failed to queue workflow: {response.status_code}")
+                print(f"[ERROR] Response: {response.text}")
+                return client_id, None
+
+        except Exception as e:
+            print(f"[ERROR] Error sending workflow: {e}")
+            return None, None
+
+    def get_prompt_history(self, prompt_id):
+        """Return the /history entry for prompt_id, or None while it has not finished."""
+        return self._poll_history(prompt_id)[1]
+
+    def _poll_history(self, prompt_id):
+        """Return (reachable, entry) for /history/<prompt_id>."""
+        try:
+            response = self.http.get(f"/history/{prompt_id}")
+            if response.status_code != 200:
+                return True, None
+            return True, response.json().get(prompt_id)
+        except Exception as e:
+            print(f"[HISTORY] History poll failed: {e}")
+            return False, None
+
+    def wait_for_completion(self, prompt_id, timeout=None, expect_frames=False):
+        """Wait for prompt_id to finish, driven by websocket events with history polling as fallback.
+
+        Returns a dict with `status` ('success', 'error', 'timeout' or
+        'backend_lost'), `error`, `history` (the /history entry when the fallback
+        poll found it) and `started` (whether ComfyUI began executing the prompt).
+        With `expect_frames` (websocket output), a history poll alone does not
+        end the wait while the websocket is connected: frames still in flight
+        arrive before the prompt's end event.
+        """
+        timeout = self.job_timeout if timeout is None else timeout
+        deadline = time.time() + timeout
+        unreachable_since = None
+        history_done_at = None
+
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    print(f"[WAIT] Prompt {prompt_id} did not finish within {timeout}s")
+                    return {'status': 'timeout', 'error': f'Generation timed out after {timeout} seconds',
+                            'history': None, 'started': True}
+
+                slice_seconds = min(self.history_poll_interval, remaining)
+                if self.events.connected:
+                    state = self.events.wait(prompt_id, slice_seconds)
+                    if state:
+                        return {'status': state['status'], 'error': state['error'], 'history': None, 'started': True}
+                else:
+                    time.sleep(slice_seconds)
+
+                # Fallback: the websocket may be down or may have dropped our events
+                reachable, entry = self._poll_history(prompt_id)
+                if entry is not None:
+                    if entry.get('status', {}).get('status_str') == 'error':
+                        return {'status': 'error', 'error': 'ComfyUI reported an execution error',
+                                'history': entry, 'started': True}
+                    if history_done_at is None:
+                        history_done_at = time.time()
+                    # Give the listener time to deliver the remaining frames, unless
+                    # the socket is down or its events for this prompt were lost
+                    if (not expect_frames or not self.events.connected
+                            or time.time() - history_done_at >= self.frame_grace):
+                        return {'status': 'success', 'error': None, 'history': entry, 'started': True}
+
+                # Neither the websocket nor HTTP answers: the backend is gone
+                if reachable or self.events.connected:
+                    unreachable_since = None
+                elif unreachable_since is None:
+                    unreachable_since = time.time()
+                elif time.time() - unreachable_since >= self.backend_lost_after:
+                    job_started = self.events.watch(prompt_id).status != 'queued'
+                    print(f"[WAIT] Backend unreachable for {self.backend_lost_after}s while waiting on {prompt_id}")
+                    return {'status': 'backend_lost', 'error': 'Lost connection to ComfyUI server.',
+                            'history': None, 'started': job_started}
+        finally:
+            self.events.forget(prompt_id)
+
+    def check_http_history(self, prompt_id, history_entry=None, output_node_id=None, prefix=None):
+        """Download the outputs of one prompt, looked up via /history/<prompt_id>.
+
+        `history_entry` can be passed when the caller already fetched it. With
+        `prefix`, the images of every output node whose files carry that
+        SaveImage prefix are taken instead (one job of a merged prompt).
+        """
+        try:
+            if history_entry is None:
+                with stage_timer('history'):
+                    history_entry = self.get_prompt_history(prompt_id)
+
+            if not history_entry:
+                print(f"[HISTORY] No history entry for prompt {prompt_id}")
+                return None
+
+            outputs = history_entry.get('outputs', {})
+            if prefix is None:
+                output_images = [(output_node_id, img) for img in outputs.get(output_node_id, {}).get('images', [])]
+            else:
+                output_images = [
+                    (node_id, img)
+                    for node_id, output in outputs.items()
+                    for img in output.get('images', [])
+                    if img.get('filename', '').startswith(f"{prefix}_")
+                ]
+            if not output_images:
+                print(f"[HISTORY] Prompt {prompt_id} has no images on node {prefix or output_node_id}")
+                return None
+
+            images = []
+            for node_id, img_info in output_images:
+                filename = img_info.get('filename')
+                if not filename:
+                    continue
+                query = urlencode({
+                    'filename': filename,
+                    'subfolder': img_info.get('subfolder', ''),
+                    'type': img_info.get('type', 'output'),
+                })
+                images.append({
+                    'filename': filename,
+                    'url': f"{self.http_server}/view?{query}",
+                    'node_id': node_id,
+                    'history_key': prompt_id
+                })
+
+            return self.download_images_from_history(images)
+
+        except Exception as e:
+            print(f"[ERROR] Error checking history: {e}")
+            return None
+
+    def download_images_from_history(self, images):
+        """Download images from ComfyUI history, several at a time."""
+        os.makedirs(self.generated_folder, exist_ok=True)
+
+        # Create unique filenames with current timestamp
+        current_timestamp = int(time.time())
+        dst_paths = [
+            os.path.join(self.generated_folder, f"generated_{current_timestamp}_{i}_{img_info['filename']}")
+            for i, img_info in enumerate(images)
+        ]
+        saved = list(self._downloads.map(self.download_image, images, dst_paths))
+
+        # Point latest_image.png at the first image for compatibility
+        if saved and saved[0]:
+            self.publish_latest(saved[0])
+        return [path for path in saved if path]
+
+    def download_image(self, img_info, dst_path):
+        """Stream one output from /view to dst_path; returns dst_path, or None on failure.
+
+        Chunks go to a temporary file that is renamed into place, so memory
+        use does not grow with the image size and readers never see a partial file.
+        """
+        try:
+            with stage_timer('download'), self.http.get(img_info['url'], stream=True) as response:
+                if response.status_code != 200:
+                    STAGE_FAILURES.inc(stage='download')
+                    print(f"[ERROR] Failed to download {img_info['filename']}: {response.status_code}")
+                    return None
+                atomic_write(dst_path, response.iter_content(DOWNLOAD_CHUNK_SIZE))
+        except Exception as e:
+            print(f"[ERROR] Error downloading image: {e}")
+            return None
+
+        self.track_output(dst_path)
+        return dst_path
+
+    def publish_latest(self, path):
+        """Atomically point latest_image.png at `path` (a hard link, not a second copy)."""
+        try:
+            replace_with_link(path, os.path.join(self.generated_folder, LATEST_IMAGE_NAME))
+        except OSError as e:
+            print(f"[ERROR] Could not update {LATEST_IMAGE_NAME}: {e}")
+
+    def use_websocket_output(self, workflow, save_node_id):
+        """Swap the SaveImage node for SaveImageWebsocket so outputs arrive as binary frames.
+
+        Requires ComfyUI's `websocket_image_save.py` custom node on the backend.
+        """
+        self.events.image_node_ids.add(save_node_id)
+        save_node = workflow[save_node_id]
+        workflow[save_node_id] = {
+            "inputs": {"images": save_node["inputs"]["images"]},
+            "class_type": "SaveImageWebsocket",
+            "_meta": {"title": "SaveImageWebsocket"}
+        }
+        return workflow
+
+    def websocket_image_writer(self, prefix):
+        """Return (sink, saved_paths): the sink writes each received frame into the generated folder.
+
+        Frames are written under a temporary name and renamed into place, so
+        readers never see a partial file.
+        """
+        os.makedirs(self.generated_folder, exist_ok=True)
+        current_timestamp = int(time.time())
+        saved = []
+
+        def sink(node_id, data, image_format):
+            i = len(saved)
+            dst_name = f"generated_{current_timestamp}_{i}_{prefix}_{i:05d}_.{image_format}"
+            dst_path = os.path.join(self.generated_folder, dst_name)
+            atomic_write(dst_path, data)
+            saved.append(dst_path)
+            self.track_output(dst_path)
+
+            # Point latest_image.png at the first image for compatibility
+            if i == 0 and image_format == 'png':
+                self.publish_latest(dst_path)
+
+        return sink, saved
+
+    @staticmethod
+    def new_result():
+        return {
+            'success': False,
+            'error': None,
+            'retryable': False,
+            'prompt_id': None,
+            'client_id': None,
+            'prefix': None,
+            'seed': None,
+            'images': [],
+        }
+
+    def generate(self, image1_path, image2_path, positive_prompt, negative_prompt, seed=None, template=None,
+                 job_id=None):
+        """Run the whole workflow and return a result dict instead of printing it.
+
+        The dict always carries `success` and `error`; on success it also has
+        `prompt_id`, `client_id`, `prefix`, `seed` and `images` (absolute paths
+        of exactly the files this job wrote to the generated folder, named
+        after `job_id`). `retryable` is set when the job failed before it
+        started on this backend, so a backend pool can safely run it elsewhere.
+        """
+        result = self.new_result()
+
+        if not self.test_comfyui_connection():
+            result['error'] = 'Failed to connect to ComfyUI server.'
+            result['retryable'] = True
+            return result
+
+        # On first use, give the websocket a moment to connect so no events are
+        # missed; afterwards a reconnecting listener is covered by history polling
+        if self.events.start() and not self.events.wait_connected(5):
+            print("[WS] Websocket not connected, falling back to history polling")
+
+        template, error = self.resolve_template(template)
+        if error:
+            result['error'] = error
+            return result
+
+        workflow = self.load_and_update_workflow(image1_path, image2_path, positive_prompt, negative_prompt, seed,
+                                                 template, job_id)
+        if not workflow:
+            result['error'] = 'Failed to prepare workflow.'
+            return result
+
+        result['prefix'] = template.read(workflow, 'prefix')
+        result['seed'] = template.read(workflow, 'seed')
+
+        # Frames only reach us over a connected socket; otherwise keep SaveImage
+        # and download this job's outputs through /history
+        websocket_output = self.output_mode == 'websocket' and self.events.connected
+        if websocket_output:
+            self.use_websocket_output(workflow, template.output_node)
+
+        # Load known reference embeddings instead of re-running CLIP vision
+        pending_embeddings = self.apply_embedding_cache(workflow, [image1_path, image2_path])
+
+        client_id, prompt_id = self.send_workflow_http(workflow)
+        result['client_id'] = client_id
+        result['prompt_id'] = prompt_id
+        if not prompt_id:
+            result['error'] = 'Failed to queue workflow.'
+            # No client_id means the request never reached ComfyUI
+            result['retryable'] = client_id is None
+            return result
+
+        received_images = None
+        if websocket_output:
+            sink, received_images = self.websocket_image_writer(result['prefix'])
+            self.events.set_image_sink(prompt_id, sink)
+
+        with stage_timer('execution'):
+            completion = self.wait_for_completion(prompt_id, expect_frames=received_images is not None)
+
+        if completion['status'] != 'success':
+            STAGE_FAILURES.inc(stage='execution')
+            result['error'] = completion['error']
+            result['retryable'] = completion['status'] == 'backend_lost' and not completion['started']
+            return result
+
+        if received_images is not None:
+            # Frames were written to disk as they arrived; no /history or /view round trip
+            downloaded_images = received_images
+        else:
+            downloaded_images = self.check_http_history(prompt_id, completion['history'], template.output_node)
+        if not downloaded_images:
+            result['error'] = 'No new images found.'
+            return result
+
+        result['images'] = downloaded_images
+        result['success'] = True
+
+        if pending_embeddings:
+            self.collect_embeddings(pending_embeddings)
+        return result
+
+    def generate_batch(self, batch, on_result=None):
+        """Run several requests as merged prompts; returns one result dict per request.
+
+        Each request is a dict with `images`, `positive_prompt`,
+        `negative_prompt` and optional `seed`, `template` and `job_id`.
+        Requests whose graphs share the checkpoint, sampler settings and
+        resolution go into one prompt with a shared loader chain; the others
+        are submitted as separate prompts.
+        `on_result(index, result)` is called once per request as soon as its
+        result is known, before the rest of the batch finishes.
+        """
+        results = [self.new_result() for _ in batch]
+
+        def report(indices):
+            if on_result is not None:
+                for index in indices:
+                    on_result(index, results[index])
+
+        if len(batch) == 1:
+            request = batch[0]
+            results[0] = self.generate(request['images'][0], request['images'][1], request['positive_prompt'],
+                                       request['negative_prompt'], request.get('seed'), request.get('template'),
+                                       request.get('job_id'))
+            report([0])
+            return results
+
+        if not self.test_comfyui_connection():
+            for result in results:
+                result['error'] = 'Failed to connect to ComfyUI server.'
+                result['retryable'] = True
+            report(range(len(batch)))
+            return results
+
+        if self.events.start() and not self.events.wait_connected(5):
+            print("[WS] Websocket not connected, falling back to history polling")
+
+        # Stage every reference image of the batch at once; building each
+        # workflow below then finds them staged
+        self.prepare_images_for_comfyui([path for request in batch for path in request['images']])
+
+        groups = {}
+        for index, request in enumerate(batch):
+            template, error = self.resolve_template(request.get('template'))
+            if error:
+                results[index]['error'] = error
+                report([index])
+                continue
+            image1_path, image2_path = request['images']
+            workflow = self.load_and_update_workflow(image1_path, image2_path, request['positive_prompt'],
+                                                     request['negative_prompt'], request.get('seed'), template,
+                                                     request.get('job_id'))
+            if not workflow:
+                results[index]['error'] = 'Failed to prepare workflow.'
+                report([index])
+                continue
+            results[index]['prefix'] = template.read(workflow, 'prefix')
+            results[index]['seed'] = template.read(workflow, 'seed')
+            pending_embeddings = self.apply_embedding_cache(workflow, request['images'])
+            groups.setdefault(batch_key(workflow), []).append((index, workflow, pending_embeddings))
+
+        # Queue every prompt before waiting on any, so ComfyUI does not idle
+        # between them. It runs prompts in submission order, so waiting in that
+        # order finishes each job as soon as its own prompt is done.
+        submitted = [(group, self.submit_merged(group, results)) for group in groups.values()]
+        for group, prompt_id in submitted:
+            if prompt_id:
+                self.collect_merged(group, prompt_id, results)
+            report([index for index, _, _ in group])
+        return results
+
+    def submit_merged(self, group, results):
+        """Submit a group of compatible workflows as one prompt; returns its prompt_id, or None.
+
+        Merged prompts always use SaveImage: websocket frames carry no prefix
+        to tell the jobs apart.
+        """
+        workflow = merge_workflows([workflow for _, workflow, _ in group])
+
+        client_id, prompt_id = self.send_workflow_http(workflow)
+        for index, _, _ in group:
+            results[index]['client_id'] = client_id
+            results[index]['prompt_id'] = prompt_id
+        if not prompt_id:
+            for index, _, _ in group:
+                results[index]['error'] = 'Failed to queue workflow.'
+                results[index]['retryable'] = client_id is None
+        return prompt_id
+
+    def collect_merged(self, group, prompt_id, results):
+        """Wait for a merged prompt and split its outputs between the jobs by prefix."""
+        with stage_timer('execution'):
+            completion = self.wait_for_completion(prompt_id)
+
+        if completion['status'] != 'success':
+            STAGE_FAILURES.inc(stage='execution')
+            for index, _, _ in group:
+                results[index]['error'] = completion['error']
+                results[index]['retryable'] = completion['status'] == 'backend_lost' and not completion['started']
+            return
+
+        pending = []
+        for index, _, pending_embeddings in group:
+            result = results[index]
+            images = self.check_http_history(prompt_id, completion['history'], prefix=result['prefix'])
+            if not images:
+                result['error'] = 'No new images found.'
+                continue
+            result['images'] = images
+            result['success'] = True
+            # Jobs sharing a reference image shared its IPAdapterSaveEmbeds node too
+            pending.extend(key for key in pending_embeddings if key not in pending)
+        if pending:
+            self.collect_embeddings(pending)
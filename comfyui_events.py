@@ -0,0 +1,264 @@
+"""Persistent ComfyUI websocket listener.
+
+ComfyUI only sends execution events to the client_id that queued a prompt,
+so every workflow submitted by a ComfyUIClient uses the listener's client_id
+and the listener resolves each job the moment its graph finishes.
+"""
+import json
+import struct
+import threading
+import uuid
+from collections import OrderedDict
+
+import websocket
+from websocket import create_connection
+
+# How many finished-but-unclaimed jobs to remember (events can arrive before
+# the submitter starts waiting on them)
+MAX_FINISHED_JOBS = 256
+
+# Binary frame header: >I event type, >I image format, then the encoded image
+BINARY_PREVIEW_IMAGE = 1
+IMAGE_FORMATS = {1: 'jpg', 2: 'png'}
+
+
+class _JobState:
+    """Execution state of one prompt as seen on the websocket."""
+
+    def __init__(self, prompt_id):
+        self.prompt_id = prompt_id
+        self.status = 'queued'  # queued -> running -> success | error
+        self.error = None
+        self.current_node = None
+        self.outputs = {}
+        self.done = threading.Event()
+        # Images received as binary frames from websocket output nodes
+        self.image_sink = None
+        self.pending_images = []
+        self.image_count = 0
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.current_node = None
+        self.done.set()
+
+    def as_dict(self):
+        return {
+            'prompt_id': self.prompt_id,
+            'status': self.status,
+            'error': self.error,
+            'outputs': dict(self.outputs),
+        }
+
+
+class ComfyUIEventListener:
+    """Follows executing/executed/execution_error messages per prompt_id over one websocket."""
+
+    def __init__(self, server_address, client_id=None, reconnect_delay=2, recv_timeout=30):
+        self.server_address = server_address
+        self.client_id = client_id or str(uuid.uuid4())
+        self.ws_url = f"ws://{server_address}/ws?clientId={self.client_id}"
+        self.reconnect_delay = reconnect_delay
+        self.recv_timeout = recv_timeout
+
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._connected = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._ws = None
+
+        # Node ids whose binary frames are job outputs (SaveImageWebsocket);
+        # frames from other nodes are latent previews and are dropped
+        self.image_node_ids = set()
+        self._executing = None  # (prompt_id, node_id) currently running
+
+    # ─── lifecycle ────────────────────────────────────────────────────────────
+
+    def start(self):
+        """Start the background listener thread; returns False if it was already running."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return False
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="comfyui-events", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """Stop the listener and close the websocket."""
+        self._stopping.set()
+        ws = self._ws
+        if ws:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def wait_connected(self, timeout):
+        """Block until the websocket is connected; returns False on timeout."""
+        return self._connected.wait(timeout)
+
+    # ─── job tracking ─────────────────────────────────────────────────────────
+
+    def watch(self, prompt_id):
+        """Return the state object for prompt_id, creating it if no event was seen yet."""
+        with self._lock:
+            return self._get_or_create(prompt_id)
+
+    def wait(self, prompt_id, timeout):
+        """Wait up to `timeout` seconds for prompt_id to finish.
+
+        Returns the job's state dict once it finished, or None if it is still
+        pending when the timeout expires.
+        """
+        job = self.watch(prompt_id)
+        if not job.done.wait(timeout):
+            return None
+        return job.as_dict()
+
+    def set_image_sink(self, prompt_id, sink):
+        """Deliver prompt_id's websocket output images to sink(node_id, data, image_format).
+
+        Images that arrived before the sink was registered are flushed to it
+        immediately.
+        """
+        with self._lock:
+            job = self._get_or_create(prompt_id)
+            job.image_sink = sink
+            pending, job.pending_images = job.pending_images, []
+        for node_id, data, image_format in pending:
+            sink(node_id, data, image_format)
+
+    def forget(self, prompt_id):
+        """Drop the state kept for prompt_id once the caller is done with it."""
+        with self._lock:
+            self._jobs.pop(prompt_id, None)
+
+    def _get_or_create(self, prompt_id):
+        job = self._jobs.get(prompt_id)
+        if job is None:
+            job = _JobState(prompt_id)
+            self._jobs[prompt_id] = job
+            self._trim()
+        return job
+
+    def _trim(self):
+        """Bound memory by dropping the oldest finished jobs nobody claimed."""
+        if len(self._jobs) <= MAX_FINISHED_JOBS:
+            return
+        for prompt_id in list(self._jobs):
+            if len(self._jobs) <= MAX_FINISHED_JOBS:
+                break
+            if self._jobs[prompt_id].done.is_set():
+                del self._jobs[prompt_id]
+
+    # ─── websocket loop ───────────────────────────────────────────────────────
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self._ws = create_connection(self.ws_url, timeout=10)
+                self._ws.settimeout(self.recv_timeout)
+                self._connected.set()
+                print(f"[WS] Connected to {self.ws_url}")
+                self._receive_loop()
+            except Exception as e:
+                if not self._stopping.is_set():
+                    print(f"[WS] Connection error: {e}")
+            finally:
+                self._connected.clear()
+                if self._ws:
+                    try:
+                        self._ws.close()
+                    except Exception:
+                        pass
+                    self._ws = None
+
+            if not self._stopping.is_set():
+                print(f"[WS] Reconnecting in {self.reconnect_delay}s...")
+                self._stopping.wait(self.reconnect_delay)
+
+    def _receive_loop(self):
+        while not self._stopping.is_set():
+            try:
+                message = self._ws.recv()
+            except websocket.WebSocketTimeoutException:
+                # Idle connection: make sure the peer is still there
+                self._ws.ping()
+                continue
+
+            if isinstance(message, bytes):
+                self._handle_binary(message)
+                continue
+            if not message:
+                raise ConnectionError("websocket closed by server")
+
+            try:
+                self._handle_message(json.loads(message))
+            except ValueError:
+                print(f"[WS] Ignoring malformed message: {message[:200]}")
+
+    def _handle_binary(self, message):
+        """Route an image frame from a websocket output node to its job."""
+        if len(message) < 8 or not self._executing:
+            return
+        prompt_id, node_id = self._executing
+        if node_id not in self.image_node_ids:
+            return
+        event_type, format_code = struct.unpack('>II', message[:8])
+        if event_type != BINARY_PREVIEW_IMAGE:
+            return
+        image_format = IMAGE_FORMATS.get(format_code, 'png')
+        data = message[8:]
+
+        with self._lock:
+            job = self._get_or_create(prompt_id)
+            job.image_count += 1
+            sink = job.image_sink
+            if sink is None:
+                job.pending_images.append((node_id, data, image_format))
+        if sink is not None:
+            try:
+                sink(node_id, data, image_format)
+            except Exception as e:
+                print(f"[WS] Failed to store image from node {node_id}: {e}")
+
+    def _handle_message(self, message):
+        msg_type = message.get('type')
+        data = message.get('data') or {}
+        prompt_id = data.get('prompt_id')
+        if not prompt_id:
+            return
+
+        with self._lock:
+            job = self._get_or_create(prompt_id)
+
+            if msg_type == 'execution_start':
+                job.status = 'running'
+            elif msg_type == 'executing':
+                self._executing = (prompt_id, data.get('node')) if data.get('node') is not None else None
+                if data.get('node') is None:
+                    # node=None marks the end of the prompt's execution
+                    if not job.done.is_set():
+                        job.finish('success')
+                else:
+                    job.status = 'running'
+                    job.current_node = data.get('node')
+            elif msg_type == 'executed':
+                job.outputs[str(data.get('node'))] = data.get('output') or {}
+            elif msg_type == 'execution_success':
+                if not job.done.is_set():
+                    job.finish('success')
+            elif msg_type == 'execution_error':
+                error = data.get('exception_message') or 'execution error'
+                job.finish('error', f"Node {data.get('node_id')}: {error}")
+                print(f"[WS] Prompt {prompt_id} failed: {job.error}")
+            elif msg_type == 'execution_interrupted':
+                job.finish('error', 'Execution interrupted')
+                print(f"[WS] Prompt {prompt_id} was interrupted")
@@ -0,0 +1,62 @@
+"""Pooled keep-alive HTTP session for one ComfyUI backend.
+
+Every HTTP call a ComfyUIClient makes (prompt submission, history polls,
+/view downloads, uploads, /system_stats, /free, health checks) goes through
+one requests.Session per backend, so connections are reused instead of
+opened per call. Idempotent requests (GET/HEAD) are retried with exponential
+backoff on connection errors, timeouts and 502/503/504; POSTs such as
+/prompt are sent once.
+"""
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+RETRY_STATUSES = (502, 503, 504)
+
+
+class ComfyUIHttp:
+    """Keep-alive connection pool to one ComfyUI server."""
+
+    def __init__(self, http_server, pool_size=8, connect_timeout=3.05, read_timeout=30, retries=2, backoff=0.5):
+        self.http_server = http_server
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        # One host per session: a single pool holding up to pool_size idle connections
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def url(self, path):
+        return path if path.startswith(('http://', 'https://')) else f"{self.http_server}{path}"
+
+    def request(self, method, path, timeout=None, retries=None, **kwargs):
+        """Send a request; `timeout` overrides the read timeout, `retries` the retry count of idempotent calls."""
+        method = method.upper()
+        timeout = (self.connect_timeout, timeout or self.read_timeout)
+        attempts = 1 + (self.retries if retries is None else retries) if method in IDEMPOTENT_METHODS else 1
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            try:
+                response = self.session.request(method, self.url(path), timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if last:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or last:
+                    return response
+                response.close()
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def close(self):
+        self.session.close()
@@ -1,31 +1,179 @@
+"""Application settings.
+
+Defaults live in Config.__init__. Any of them can be overridden by a JSON
+file (APP_CONFIG_FILE, or config.json next to this module) and then by an
+environment variable of the same name, e.g.
+
+    COMFYUI_SERVERS=10.0.0.5:8188,10.0.0.6:8188 JOB_WORKERS=4 python app.py
+
+Importing this module does no work: the shared `config` instance (and the
+module-level exports below) are built on first access, and nothing is
+created or printed until the server calls create_directories() /
+print_config() at startup.
+"""
+import json
 import os
-import sys
-import platform
+import threading
+
+CONFIG_FILE_ENV = 'APP_CONFIG_FILE'
+DEFAULT_CONFIG_FILE = 'config.json'
+
+TRUE_STRINGS = ('1', 'true', 'yes', 'on')
+
+
+def coerce_setting(value, default):
+    """Convert an override (a string from the environment, or a JSON value) to the type of its default."""
+    if isinstance(default, (list, tuple)):
+        if isinstance(value, str):
+            value = json.loads(value) if value.lstrip().startswith('[') else [v.strip() for v in value.split(',') if v.strip()]
+        if default and isinstance(default[0], (int, float)):
+            value = [type(default[0])(v) for v in value]
+        return type(default)(value)
+    if not isinstance(value, str) or default is None or isinstance(default, str):
+        return value
+    if isinstance(default, bool):
+        return value.strip().lower() in TRUE_STRINGS
+    if isinstance(default, int):
+        # A whole-number default still accepts a fraction, e.g. COMFYUI_READ_TIMEOUT=2.5
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+    return type(default)(value)
+
 
 class Config:
-    def __init__(self):
+    def __init__(self, environ=None, config_file=None):
         # Project root directory
         self.BASE_DIR = os.path.dirname(os.path.abspath(__file__))
         
         # Basic folders
         self.UPLOAD_FOLDER = os.path.join(self.BASE_DIR, 'uploads')
         self.GENERATED_FOLDER = os.path.join(self.BASE_DIR, 'generated')
-        self.SCRIPT_PATH = os.path.join(self.BASE_DIR, 'websocket_api_ws_images.py')
         
         # ComfyUI configuration
-        self.COMFYUI_SERVER = "127.0.0.1:8188"
-        self.COMFYUI_HTTP = f"http://{self.COMFYUI_SERVER}"
+        # Backend pool: jobs go to the least-loaded healthy server in this list
+        self.COMFYUI_SERVERS = ["127.0.0.1:8188"]
+        self.BACKEND_HEALTH_INTERVAL = 10        # seconds between /queue + /system_stats checks
+        # How reference images reach ComfyUI: 'upload' (POST /upload/image, works
+        # across hosts) or 'filesystem' (write into COMFYUI_INPUT_DIR, same host only)
+        self.COMFYUI_IMAGE_TRANSFER = 'upload'
+        # How outputs come back: 'history' (SaveImage + /view downloads) or
+        # 'websocket' (SaveImageWebsocket frames written straight to GENERATED_FOLDER;
+        # needs ComfyUI's websocket_image_save custom node)
+        self.COMFYUI_OUTPUT_MODE = 'history'
+        self.COMFYUI_JOB_TIMEOUT = 300           # seconds to wait for one prompt
+        self.COMFYUI_HISTORY_POLL_INTERVAL = 5   # fallback /history poll while waiting
+        # Keep-alive HTTP pool per backend; GET/HEAD calls are retried with
+        # exponential backoff (backoff * 2**attempt seconds)
+        self.COMFYUI_HTTP_POOL_SIZE = 8
+        self.COMFYUI_CONNECT_TIMEOUT = 3.05      # seconds
+        self.COMFYUI_READ_TIMEOUT = 30           # seconds
+        self.COMFYUI_HTTP_RETRIES = 2
+        self.COMFYUI_HTTP_BACKOFF = 0.5          # seconds
+
+        # Model residency: 'auto' keeps models loaded and only calls /free when
+        # /system_stats usage exceeds these fractions or the checkpoint changes
+        self.COMFYUI_RESIDENCY_MODE = 'auto'     # 'auto' | 'never' | 'always'
+        self.COMFYUI_VRAM_THRESHOLD = 0.90
+        self.COMFYUI_RAM_THRESHOLD = 0.90
+
+        # Workflow templates: API-format JSON files listed in workflows/templates.json
+        self.WORKFLOWS_FOLDER = os.path.join(self.BASE_DIR, 'workflows')
+        self.WORKFLOW_RELOAD_INTERVAL = 2        # seconds between file change checks
+
+        # IP-Adapter reference embeddings cached by image hash + model + weight
+        self.EMBEDDING_CACHE_ENABLED = True
+        self.EMBEDDING_CACHE_FOLDER = os.path.join(self.BASE_DIR, 'embeds_cache')
+        self.EMBEDDING_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+        # Finished outputs keyed by image hashes + prompts + seed + template
+        self.RESULT_CACHE_ENABLED = True
+        self.RESULT_CACHE_FOLDER = os.path.join(self.BASE_DIR, 'results_cache')
+        self.RESULT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+        # Seconds browsers may reuse latest_image.png before revalidating
+        self.GENERATED_ALIAS_MAX_AGE = 5
+
+        # Resized variants served for /generated/<file>?w=<width>&fmt=<format>;
+        # the default one is rendered as soon as a job finishes
+        self.THUMBNAIL_WIDTHS = (128, 256, 512)
+        self.THUMBNAIL_DEFAULT_WIDTH = 256
+        self.THUMBNAIL_DEFAULT_FORMAT = 'webp'
+        self.THUMBNAIL_WORKERS = 2
+
+        # Retention janitor: generated outputs and (filesystem transfer) staged
+        # inputs are evicted least recently used first over budget or age
+        self.RETENTION_INTERVAL = 60             # seconds between sweeps
+        self.GENERATED_MAX_BYTES = 1024 * 1024 * 1024
+        self.GENERATED_MAX_AGE = 24 * 3600
+        self.COMFYUI_INPUT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+        self.COMFYUI_INPUT_MAX_AGE = 7 * 24 * 3600
+
+        # In-process job queue behind /jobs and /generate
+        self.JOB_QUEUE_SIZE = 16
+        self.JOB_WORKERS = 2
+        # Micro-batching: jobs arriving within the window (up to the max size)
+        # that share checkpoint, sampler settings and resolution are merged
+        # into one ComfyUI prompt; a max size of 1 disables merging. Off by
+        # default: a merged prompt runs on one backend, its sampler branches
+        # still run one after another, and every job in it waits for the whole
+        # prompt. Only worth enabling with a single, saturated backend.
+        self.JOB_BATCH_WINDOW = 0.2              # seconds
+        self.JOB_BATCH_MAX_SIZE = 1
+
+        # Both servers refuse larger uploads
+        self.UPLOAD_MAX_BYTES = 32 * 1024 * 1024 # per uploaded image
+
+        # Asyncio server (python async_app.py)
+        self.ASYNC_IO_WORKERS = 8                # threads for file I/O off the event loop
         
         # Auto-detect paths
         self.COMFYUI_DIR = r"C:\Users\nomy_\Downloads\ComfyUI\ComfyUI_windows_portable"   # self.find_comfyui_dir()
-        self.COMFYUI_INPUT_DIR = os.path.join(self.COMFYUI_DIR, "ComfyUI\input")
-        self.PYTHON_EXECUTABLE = self.find_python_executable()
-        
-        # Create necessary directories
-        self.create_directories()
-        
-        # Print configuration info
-        self.print_config()
+        self.COMFYUI_INPUT_DIR = None            # defaults to <COMFYUI_DIR>\ComfyUI\input
+
+        # Result of validate_setup(), computed once
+        self._setup_valid = None
+
+        environ = os.environ if environ is None else environ
+        self.apply_overrides(self.read_config_file(config_file or environ.get(CONFIG_FILE_ENV)))
+        self.apply_overrides({name: environ[name] for name in self.setting_names() if name in environ})
+
+        if self.COMFYUI_INPUT_DIR is None:
+            self.COMFYUI_INPUT_DIR = os.path.join(self.COMFYUI_DIR, "ComfyUI\\input")
+
+    @property
+    def COMFYUI_SERVER(self):
+        return self.COMFYUI_SERVERS[0]
+
+    @property
+    def COMFYUI_HTTP(self):
+        return f"http://{self.COMFYUI_SERVER}"
+
+    def setting_names(self):
+        return [name for name in vars(self) if name.isupper()]
+
+    def read_config_file(self, path=None):
+        """Settings from a JSON file; the default file is optional, an explicitly named one is not."""
+        if path is None:
+            path = os.path.join(self.BASE_DIR, DEFAULT_CONFIG_FILE)
+            if not os.path.exists(path):
+                return {}
+        with open(path, encoding='utf-8-sig') as f:
+            settings = json.load(f)
+        if not isinstance(settings, dict):
+            raise ValueError(f"{path} must contain a JSON object of settings")
+        return settings
+
+    def apply_overrides(self, overrides):
+        known = set(self.setting_names())
+        for name, value in overrides.items():
+            if name not in known:
+                raise ValueError(f"Unknown setting: {name}")
+            try:
+                setattr(self, name, coerce_setting(value, getattr(self, name)))
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid value for {name}: {value!r} ({e})") from None
     
     def find_comfyui_dir(self):
         """Automatically find ComfyUI installation directory"""
@@ -111,26 +259,6 @@ class Config:
         print(f"[WARNING] Created local input directory: {fallback}")
         return fallback
     
-    def find_python_executable(self):
-        """Find the correct Python executable"""
-        # Prioritize virtual environment Python
-        venv_paths = [
-            os.path.join(self.BASE_DIR, 'venv', 'Scripts', 'python.exe'),  # Windows
-            os.path.join(self.BASE_DIR, 'venv', 'bin', 'python'),          # Linux/Mac
-            os.path.join(self.BASE_DIR, '.venv', 'Scripts', 'python.exe'), # Windows alt
-            os.path.join(self.BASE_DIR, '.venv', 'bin', 'python'),         # Linux/Mac alt
-        ]
-        
-        for path in venv_paths:
-            if os.path.exists(path):
-                print(f"[SUCCESS] Using virtual environment Python: {path}")
-                return path
-        
-        # Use system Python
-        system_python = sys.executable
-        print(f"[WARNING] Using system Python: {system_python}")
-        return system_python
-    
     def create_directories(self):
         """Create necessary directories"""
         directories = [
@@ -138,7 +266,7 @@ class Config:
             self.GENERATED_FOLDER,
         ]
         
-        if self.COMFYUI_INPUT_DIR:
+        if self.COMFYUI_INPUT_DIR and self.COMFYUI_IMAGE_TRANSFER == 'filesystem':
             directories.append(self.COMFYUI_INPUT_DIR)
         
         for directory in directories:
@@ -152,43 +280,39 @@ class Config:
         print(f"Project Directory: {self.BASE_DIR}")
         print(f"Upload Directory: {self.UPLOAD_FOLDER}")
         print(f"Generated Directory: {self.GENERATED_FOLDER}")
-        print(f"Python Executable: {self.PYTHON_EXECUTABLE}")
-        print(f"Script Path: {self.SCRIPT_PATH}")
         print(f"ComfyUI Directory: {self.COMFYUI_DIR}")
         print(f"ComfyUI Input Directory: {self.COMFYUI_INPUT_DIR}")
         print(f"ComfyUI Server: {self.COMFYUI_HTTP}")
         print("="*60)
     
-    def validate_setup(self):
-        """Validate if setup is correct"""
+    def validate_setup(self, refresh=False):
+        """Validate if setup is correct (checked once, then cached unless `refresh`)"""
+        if self._setup_valid is not None and not refresh:
+            return self._setup_valid
+
         issues = []
         
-        # Check Python executable
-        if not os.path.exists(self.PYTHON_EXECUTABLE):
-            issues.append(f"[ERROR] Python executable does not exist: {self.PYTHON_EXECUTABLE}")
-        
-        # Check script file
-        if not os.path.exists(self.SCRIPT_PATH):
-            issues.append(f"[ERROR] Script file does not exist: {self.SCRIPT_PATH}")
-        
-        # Check ComfyUI directory
-        if not self.COMFYUI_DIR:
-            issues.append("[ERROR] ComfyUI installation directory not found")
-        elif not os.path.exists(self.COMFYUI_DIR):
-            issues.append(f"[ERROR] ComfyUI directory does not exist: {self.COMFYUI_DIR}")
-        
-        # Check input directory
-        if not os.path.exists(self.COMFYUI_INPUT_DIR):
-            issues.append(f"[ERROR] ComfyUI input directory does not exist: {self.COMFYUI_INPUT_DIR}")
+        # Local ComfyUI directories only matter when images are written to disk
+        if self.COMFYUI_IMAGE_TRANSFER == 'filesystem':
+            # Check ComfyUI directory
+            if not self.COMFYUI_DIR:
+                issues.append("[ERROR] ComfyUI installation directory not found")
+            elif not os.path.exists(self.COMFYUI_DIR):
+                issues.append(f"[ERROR] ComfyUI directory does not exist: {self.COMFYUI_DIR}")
+            
+            # Check input directory
+            if not os.path.exists(self.COMFYUI_INPUT_DIR):
+                issues.append(f"[ERROR] ComfyUI input directory does not exist: {self.COMFYUI_INPUT_DIR}")
         
         if issues:
             print("\n[ERROR] Found the following issues:")
             for issue in issues:
                 print(f"   {issue}")
-            return False
+            self._setup_valid = False
         else:
             print("\n[SUCCESS] All configuration checks passed!")
-            return True
+            self._setup_valid = True
+        return self._setup_valid
     
     def get_install_commands(self):
         """Generate installation commands"""
@@ -200,26 +324,50 @@ class Config:
             "",
             "# Install dependencies",
             "pip install flask flask-cors websocket-client pillow requests",
+            "pip install aiohttp  # optional: python async_app.py",
             "",
             "# Verify installation",
             f'python -c "import config; config.Config().validate_setup()"'
         ]
         return "\n".join(commands)
 
-# Create global configuration instance
-config = Config()
+# Global configuration instance, created on first access
+_config = None
+_config_lock = threading.Lock()
+
+
+def get_config():
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                _config = Config()
+    return _config
+
 
 # Export common configurations
-BASE_DIR = config.BASE_DIR
-UPLOAD_FOLDER = config.UPLOAD_FOLDER
-GENERATED_FOLDER = config.GENERATED_FOLDER
-SCRIPT_PATH = config.SCRIPT_PATH
-COMFYUI_HTTP = config.COMFYUI_HTTP
-COMFYUI_INPUT_DIR = config.COMFYUI_INPUT_DIR
-PYTHON_EXECUTABLE = config.PYTHON_EXECUTABLE
+EXPORTS = (
+    'BASE_DIR',
+    'UPLOAD_FOLDER',
+    'GENERATED_FOLDER',
+    'COMFYUI_HTTP',
+    'COMFYUI_INPUT_DIR',
+)
+
+
+def __getattr__(name):
+    # `from config import config` and the exports resolve here (PEP 562)
+    if name == 'config':
+        return get_config()
+    if name in EXPORTS:
+        return getattr(get_config(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
     print("Configuration Check Tool")
+    config = get_config()
+    config.print_config()
     if config.validate_setup():
         print("\n[SUCCESS] System configuration is correct, ready to start!")
     else:
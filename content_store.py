@@ -0,0 +1,105 @@
+"""Content-addressed storage helpers.
+
+Uploaded reference images are stored once under the SHA-256 of their bytes,
+so identical uploads map to the same file and the same ComfyUI input name.
+"""
+import hashlib
+import os
+import re
+import shutil
+import threading
+
+CHUNK_SIZE = 1024 * 1024
+
+_DIGEST_NAME = re.compile(r'^([0-9a-f]{64})\.[A-Za-z0-9]+$')
+
+# (path, size, mtime) -> digest, so repeated lookups don't re-read files
+MAX_CACHED_DIGESTS = 4096
+_digest_cache = {}
+_digest_lock = threading.Lock()
+
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path):
+    """Hash a file in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """Return the SHA-256 of a file, trusting digest-named files from the upload store."""
+    match = _DIGEST_NAME.match(os.path.basename(path))
+    if match:
+        return match.group(1)
+
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    with _digest_lock:
+        digest = _digest_cache.get(key)
+    if digest is None:
+        digest = sha256_file(path)
+        with _digest_lock:
+            if len(_digest_cache) >= MAX_CACHED_DIGESTS:
+                _digest_cache.clear()
+            _digest_cache[key] = digest
+    return digest
+
+
+def temp_path(path):
+    """A sibling of `path` to write before renaming into place, unique per process and thread."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def atomic_write(path, data):
+    """Write bytes (or an iterable of byte chunks) to `path` through a temp file and rename.
+
+    Readers never see a partial file; on failure the temp file is removed
+    and the error re-raised.
+    """
+    tmp_path = temp_path(path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                f.write(data)
+            else:
+                for chunk in data:
+                    f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def replace_with_link(src, dst):
+    """Atomically make `dst` a hard link to `src` (a copy when linking is not possible)."""
+    tmp_path = temp_path(dst)
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+    # rename() is a no-op when dst already was a link to src
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+
+
+def store_bytes(folder, data, ext):
+    """Store `data` as <folder>/<sha256>.<ext> unless it is already there.
+
+    Returns (path, digest, created).
+    """
+    digest = sha256_bytes(data)
+    path = os.path.join(folder, f"{digest}.{ext}")
+    if os.path.exists(path):
+        return path, digest, False
+
+    os.makedirs(folder, exist_ok=True)
+    atomic_write(path, data)
+    return path, digest, True
@@ -0,0 +1,247 @@
+"""Persistent cache of IP-Adapter reference embeddings.
+
+The IP-Adapter workflow encodes both reference images with the CLIP-ViT-H
+vision model on every job (PrepImageForClipVision -> IPAdapterEncoder). Users
+reuse the same references with different prompts and seeds, so the encoder
+output is cached per image:
+
+- on a miss, IPAdapterSaveEmbeds nodes are added to the graph and the saved
+  `.ipadpt` files are fetched from ComfyUI after the job;
+- on a hit, the encoder branch is replaced by IPAdapterLoadEmbeds reading the
+  cached file, and when every reference hits the CLIP vision loader is
+  dropped from the graph entirely.
+
+Keys cover the image content hash, the IP-Adapter model, the CLIP vision
+model, the encoder weight and the prep settings. The local store has a byte
+budget with least-recently-used eviction.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from content_store import atomic_write
+
+# (LoadImage, PrepImageForClipVision, IPAdapterEncoder) per reference image
+ENCODER_SLOTS = (
+    ("49", "61", "66"),
+    ("62", "63", "67"),
+)
+IPADAPTER_LOADER_NODE = "46"
+CLIP_VISION_LOADER_NODE = "47"
+EMBEDS_NODE = "65"
+NEGATIVE_EMBEDS_NODE = "ipadpt_negative"
+
+EMBEDS_EXT = ".ipadpt"
+
+
+def embedding_key(image_digest, workflow, encoder_node, prep_node):
+    """Cache key for one reference image's positive embedding."""
+    prep = workflow[prep_node]["inputs"]
+    parts = [
+        image_digest,
+        workflow[IPADAPTER_LOADER_NODE]["inputs"].get("ipadapter_file"),
+        workflow[CLIP_VISION_LOADER_NODE]["inputs"].get("clip_name"),
+        workflow[encoder_node]["inputs"].get("weight"),
+        prep.get("interpolation"),
+        prep.get("crop_position"),
+        prep.get("sharpening"),
+    ]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()[:40]
+
+
+def negative_key(workflow, encoder_node):
+    """Cache key for the image-independent negative embedding (zero image)."""
+    parts = [
+        "negative",
+        workflow[IPADAPTER_LOADER_NODE]["inputs"].get("ipadapter_file"),
+        workflow[CLIP_VISION_LOADER_NODE]["inputs"].get("clip_name"),
+        workflow[encoder_node]["inputs"].get("weight"),
+    ]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()[:40]
+
+
+def comfyui_name(key):
+    """Name of a cached embedding in ComfyUI's input (and output) directory."""
+    return f"ipadpt_{key}{EMBEDS_EXT}"
+
+
+def saved_output_name(key):
+    """File IPAdapterSaveEmbeds writes for prefix ipadpt_<key> (first counter)."""
+    return f"ipadpt_{key}_00001{EMBEDS_EXT}"
+
+
+def supports_workflow(workflow):
+    """True when the graph has the encoder layout the cache rewrites (node ids above)."""
+    expected = {
+        IPADAPTER_LOADER_NODE: "IPAdapterModelLoader",
+        CLIP_VISION_LOADER_NODE: "CLIPVisionLoader",
+        EMBEDS_NODE: "IPAdapterEmbeds",
+    }
+    for load_node, prep_node, encoder_node in ENCODER_SLOTS:
+        expected.update({load_node: "LoadImage", prep_node: "PrepImageForClipVision", encoder_node: "IPAdapterEncoder"})
+    return all(workflow.get(node_id, {}).get("class_type") == class_type for node_id, class_type in expected.items())
+
+
+class EmbeddingCache:
+    """On-disk store of `.ipadpt` files with a byte budget and LRU eviction."""
+
+    def __init__(self, folder, max_bytes=512 * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load_index()
+
+    def _load_index(self):
+        """Build the in-memory index once; access order is approximated by mtime."""
+        os.makedirs(self.folder, exist_ok=True)
+        found = []
+        for name in os.listdir(self.folder):
+            if name.endswith(EMBEDS_EXT):
+                path = os.path.join(self.folder, name)
+                stat = os.stat(path)
+                found.append((stat.st_mtime, name[:-len(EMBEDS_EXT)], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total += size
+        if found:
+            print(f"[EMBEDS] Loaded {len(found)} cached embeddings ({self._total} bytes)")
+
+    def path(self, key):
+        return os.path.join(self.folder, f"{key}{EMBEDS_EXT}")
+
+    def contains(self, key):
+        """Return True and mark the entry as recently used if `key` is cached."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return False
+            self._entries.move_to_end(key)
+            self.hits += 1
+        try:
+            # Persist recency for the index rebuilt on the next start
+            os.utime(self.path(key))
+        except OSError:
+            pass
+        return True
+
+    def read(self, key):
+        with open(self.path(key), 'rb') as f:
+            return f.read()
+
+    def put(self, key, data):
+        """Store an embedding and evict least recently used entries over budget."""
+        path = self.path(key)
+        atomic_write(path, data)
+
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._total -= self._entries.pop(key)
+            self._entries[key] = len(data)
+            self._total += len(data)
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                old_key, size = self._entries.popitem(last=False)
+                self._total -= size
+                evicted.append(old_key)
+
+        for old_key in evicted:
+            try:
+                os.remove(self.path(old_key))
+                print(f"[EMBEDS] Evicted {old_key}")
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def plan_embeddings(cache, workflow, image_digests):
+    """Decide per reference image whether its embedding can be loaded from the cache.
+
+    Returns (hits, misses, negative) where hits/misses map slot index to key
+    and `negative` is (key, cached) for the shared negative embedding.
+    """
+    hits, misses = {}, {}
+    for index, (load_node, prep_node, encoder_node) in enumerate(ENCODER_SLOTS):
+        key = embedding_key(image_digests[index], workflow, encoder_node, prep_node)
+        if cache.contains(key):
+            hits[index] = key
+        else:
+            misses[index] = key
+
+    neg_key = negative_key(workflow, ENCODER_SLOTS[0][2])
+    return hits, misses, (neg_key, cache.contains(neg_key))
+
+
+def apply_cached_embeddings(workflow, hits, negative, staged_names):
+    """Replace cached encoder branches by IPAdapterLoadEmbeds nodes.
+
+    `staged_names` maps cache keys to the names staged on the backend. When
+    every reference hits (and the negative embedding is cached), the CLIP
+    vision loader is removed and node 65 gets the negative embedding instead.
+    """
+    for index, key in hits.items():
+        load_node, prep_node, encoder_node = ENCODER_SLOTS[index]
+        workflow.pop(load_node, None)
+        workflow.pop(prep_node, None)
+        workflow[encoder_node] = {
+            "inputs": {"embeds": staged_names[key]},
+            "class_type": "IPAdapterLoadEmbeds",
+            "_meta": {"title": "IPAdapter Load Embeds (cached)"}
+        }
+
+    neg_key, neg_cached = negative
+    if len(hits) == len(ENCODER_SLOTS) and neg_cached:
+        workflow[NEGATIVE_EMBEDS_NODE] = {
+            "inputs": {"embeds": staged_names[neg_key]},
+            "class_type": "IPAdapterLoadEmbeds",
+            "_meta": {"title": "IPAdapter Load Negative Embeds (cached)"}
+        }
+        embeds_inputs = dict(workflow[EMBEDS_NODE]["inputs"])
+        embeds_inputs.pop("clip_vision", None)
+        embeds_inputs["neg_embed"] = [NEGATIVE_EMBEDS_NODE, 0]
+        workflow[EMBEDS_NODE] = dict(workflow[EMBEDS_NODE], inputs=embeds_inputs)
+        workflow.pop(CLIP_VISION_LOADER_NODE, None)
+        return True
+    return False
+
+
+def add_embedding_savers(workflow, misses, negative):
+    """Add IPAdapterSaveEmbeds nodes for every embedding not cached yet.
+
+    Returns the keys whose `.ipadpt` files should be fetched after the job.
+    """
+    pending = []
+    for index, key in misses.items():
+        encoder_node = ENCODER_SLOTS[index][2]
+        workflow[f"ipadpt_save_{encoder_node}"] = {
+            "inputs": {"embeds": [encoder_node, 0], "filename_prefix": f"ipadpt_{key}"},
+            "class_type": "IPAdapterSaveEmbeds",
+            "_meta": {"title": "IPAdapter Save Embeds (cache)"}
+        }
+        pending.append(key)
+
+    neg_key, neg_cached = negative
+    if not neg_cached and misses:
+        # Output 1 of IPAdapterEncoder is the zero-image negative embedding
+        encoder_node = ENCODER_SLOTS[min(misses)][2]
+        workflow["ipadpt_save_negative"] = {
+            "inputs": {"embeds": [encoder_node, 1], "filename_prefix": f"ipadpt_{neg_key}"},
+            "class_type": "IPAdapterSaveEmbeds",
+            "_meta": {"title": "IPAdapter Save Negative Embeds (cache)"}
+        }
+        pending.append(neg_key)
+    return pending
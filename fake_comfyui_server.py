@@ -0,0 +1,150 @@
+"""Minimal ComfyUI stand-in for exercising the backend pool without a GPU.
+
+Implements the HTTP endpoints the client uses (/, /prompt, /queue,
+/history/<prompt_id>, /view, /upload/image, /system_stats, /free,
+/interrupt). Prompts run one at a time and "finish" after --delay seconds
+with --batch placeholder images on their SaveImage nodes. There is no
+websocket, so clients fall back to history polling.
+
+Example: start two fake backends and point COMFYUI_SERVERS at both
+
+    python fake_comfyui_server.py --port 8188 --delay 3
+    python fake_comfyui_server.py --port 8189 --delay 3 --vram-free 0.2
+"""
+import argparse
+import io
+import threading
+import time
+import uuid
+from collections import deque
+
+from flask import Flask, jsonify, request, send_file
+from PIL import Image
+
+app = Flask(__name__)
+
+state = {
+    'delay': 3.0,
+    'batch': 4,
+    'vram_free': 0.8,
+}
+pending = deque()
+running = []
+history = {}
+uploads = {}
+lock = threading.Condition()
+
+
+def placeholder_png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (128, 128, 128)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def worker():
+    """Execute queued prompts one after another, like ComfyUI's prompt worker."""
+    while True:
+        with lock:
+            lock.wait_for(lambda: pending)
+            prompt_id, prompt = pending.popleft()
+            running.append(prompt_id)
+
+        time.sleep(state['delay'])
+
+        outputs = {}
+        for node_id, node in prompt.items():
+            if node.get('class_type') == 'SaveImage':
+                prefix = node['inputs'].get('filename_prefix', 'ComfyUI')
+                outputs[node_id] = {'images': [
+                    {'filename': f"{prefix}_{i:05d}_.png", 'subfolder': '', 'type': 'output'}
+                    for i in range(state['batch'])
+                ]}
+
+        with lock:
+            running.remove(prompt_id)
+            history[prompt_id] = {
+                'prompt': [0, prompt_id, prompt, {}, list(outputs)],
+                'outputs': outputs,
+                'status': {'status_str': 'success', 'completed': True, 'messages': []},
+            }
+        print(f"[FAKE] Finished prompt {prompt_id}")
+
+
+@app.route('/')
+def index():
+    return 'fake comfyui'
+
+
+@app.route('/prompt', methods=['POST'])
+def queue_prompt():
+    prompt = request.json.get('prompt') or {}
+    prompt_id = str(uuid.uuid4())
+    with lock:
+        pending.append((prompt_id, prompt))
+        number = len(pending) + len(running)
+        lock.notify_all()
+    return jsonify({'prompt_id': prompt_id, 'number': number, 'node_errors': {}})
+
+
+@app.route('/queue', methods=['GET', 'POST'])
+def queue_status():
+    with lock:
+        if request.method == 'POST':
+            if (request.json or {}).get('clear'):
+                pending.clear()
+            return jsonify({})
+        return jsonify({
+            'queue_running': [[0, prompt_id] for prompt_id in running],
+            'queue_pending': [[0, prompt_id] for prompt_id, _ in pending],
+        })
+
+
+@app.route('/history/<prompt_id>')
+def prompt_history(prompt_id):
+    with lock:
+        entry = history.get(prompt_id)
+    return jsonify({prompt_id: entry} if entry else {})
+
+
+@app.route('/view')
+def view():
+    return send_file(io.BytesIO(placeholder_png()), mimetype='image/png')
+
+
+@app.route('/upload/image', methods=['POST'])
+def upload_image():
+    image = request.files['image']
+    uploads[image.filename] = len(image.read())
+    return jsonify({'name': image.filename, 'subfolder': request.form.get('subfolder', ''), 'type': 'input'})
+
+
+@app.route('/system_stats')
+def system_stats():
+    total = 24 * 1024 ** 3
+    return jsonify({
+        'system': {'ram_total': 64 * 1024 ** 3, 'ram_free': 48 * 1024 ** 3},
+        'devices': [{'name': 'fake:0', 'vram_total': total, 'vram_free': int(total * state['vram_free'])}],
+    })
+
+
+@app.route('/free', methods=['POST'])
+def free():
+    return jsonify({})
+
+
+@app.route('/interrupt', methods=['POST'])
+def interrupt():
+    return jsonify({})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake ComfyUI backend for local testing')
+    parser.add_argument('--port', type=int, default=8188)
+    parser.add_argument('--delay', type=float, default=3.0, help='seconds each prompt takes')
+    parser.add_argument('--batch', type=int, default=4, help='images per SaveImage node')
+    parser.add_argument('--vram-free', type=float, default=0.8, help='reported free VRAM fraction')
+    args = parser.parse_args()
+
+    state.update(delay=args.delay, batch=args.batch, vram_free=args.vram_free)
+    threading.Thread(target=worker, daemon=True).start()
+    app.run(host='127.0.0.1', port=args.port, threaded=True)
@@ -0,0 +1,93 @@
+"""Optimization pass for outgoing ComfyUI graphs.
+
+Templates exported from the ComfyUI editor carry leftovers: the IP-Adapter
+templates load a VAELoader (node "45") that nothing uses because VAEDecode
+takes the checkpoint's VAE. ComfyUI validates every node of a prompt, so such
+nodes still cost time, and depending on the node they can cost a model load.
+
+The pass merges duplicate nodes (same class, inputs and upstream nodes; in
+practice repeated loaders) and drops every node that does not feed an output
+node. It runs once on each template when it is loaded and again on every
+prompt right before submission, after per-request rewrites.
+"""
+from micro_batch import is_link, node_signatures
+
+# Node classes ComfyUI executes as outputs (OUTPUT_NODE = True); used when the
+# backend's /object_info is not known
+OUTPUT_NODE_CLASSES = frozenset({
+    'SaveImage',
+    'PreviewImage',
+    'SaveImageWebsocket',
+    'SaveAnimatedWEBP',
+    'SaveAnimatedPNG',
+    'SaveLatent',
+    'IPAdapterSaveEmbeds',
+})
+
+
+def output_classes_from_object_info(object_info):
+    return frozenset(name for name, info in object_info.items() if info.get('output_node'))
+
+
+def optimize_workflow(workflow, output_classes=OUTPUT_NODE_CLASSES, pinned=()):
+    """Return (optimized workflow, report) without modifying `workflow`.
+
+    Nodes in `pinned` are never removed or merged (template patch points).
+    The report has `merged` (removed id -> kept id) and `pruned` (id -> class).
+    """
+    report = {'merged': {}, 'pruned': {}}
+
+    # Merge duplicates into the first node with the same signature
+    signatures = node_signatures(workflow, unique=pinned)
+    kept = {}
+    replacements = {}
+    for node_id, node in workflow.items():
+        if node_id in pinned or node['class_type'] in output_classes:
+            continue
+        first = kept.setdefault(signatures[node_id], node_id)
+        if first != node_id:
+            replacements[node_id] = first
+    report['merged'] = dict(replacements)
+
+    optimized = {}
+    for node_id, node in workflow.items():
+        if node_id in replacements:
+            continue
+        if any(is_link(value) and value[0] in replacements for value in node['inputs'].values()):
+            inputs = {
+                name: [replacements[value[0]], value[1]] if is_link(value) and value[0] in replacements else value
+                for name, value in node['inputs'].items()
+            }
+            node = dict(node, inputs=inputs)
+        optimized[node_id] = node
+
+    # Keep only what the output nodes (and pinned nodes) depend on
+    outputs = [node_id for node_id, node in optimized.items() if node['class_type'] in output_classes]
+    if not outputs:
+        # Unknown output classes: pruning would drop the whole graph
+        return optimized, report
+    live = set()
+    stack = outputs + [node_id for node_id in pinned if node_id in optimized]
+    while stack:
+        node_id = stack.pop()
+        if node_id in live:
+            continue
+        live.add(node_id)
+        for value in optimized[node_id]['inputs'].values():
+            if is_link(value) and value[0] in optimized:
+                stack.append(value[0])
+
+    for node_id in list(optimized):
+        if node_id not in live:
+            report['pruned'][node_id] = optimized.pop(node_id)['class_type']
+    return optimized, report
+
+
+def describe_report(report):
+    """One-line summary for logs, or None when nothing changed."""
+    parts = []
+    if report['pruned']:
+        parts.append("pruned " + ", ".join(f"{node_id} ({cls})" for node_id, cls in report['pruned'].items()))
+    if report['merged']:
+        parts.append("merged " + ", ".join(f"{node_id} into {kept}" for node_id, kept in report['merged'].items()))
+    return "; ".join(parts) or None
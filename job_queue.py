@@ -0,0 +1,404 @@
+"""Bounded in-process job queue feeding the ComfyUI client.
+
+The HTTP layer submits a job and returns its id immediately; worker threads
+run jobs through the backend's generate() (a ComfyUIClient or a BackendPool)
+and every status change (queued -> running -> done | error) wakes up
+pollers and SSE streams.
+Threads wait on the job's condition; the asyncio server subscribes a
+callback instead, so a waiting request does not hold a thread.
+
+With micro-batching enabled, a worker that picks up a job keeps collecting
+jobs for `batch_window` seconds (up to `max_batch_size`) and hands them to
+generate_batch(), which merges compatible ones into a single ComfyUI prompt.
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from content_store import file_digest
+from metrics import JOB_QUEUE_DEPTH, JOBS_IN_FLIGHT, JOBS_TOTAL, STAGE_SECONDS
+from result_cache import result_key
+
+# Finished jobs kept in memory for GET /jobs/<id>
+MAX_FINISHED_JOBS = 1000
+
+TERMINAL_STATUSES = ('done', 'error')
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused for a different request."""
+
+
+class Job:
+    """One generation request and its current status."""
+
+    def __init__(self, params):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.status = 'queued'
+        self.error = None
+        self.prompt_id = None
+        self.backend = None
+        self.seed = params.get('seed')
+        self.cached = False
+        self.fingerprint = None
+        # Duplicate requests attached to this job instead of queuing their own
+        self.coalesced = 0
+        self.images = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Bumped on every status change; SSE streams wait on it
+        self.version = 0
+        self.changed = threading.Condition()
+        self._listeners = []
+
+    @property
+    def finished(self):
+        return self.status in TERMINAL_STATUSES
+
+    def update(self, **fields):
+        with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self.changed.notify_all()
+            listeners = list(self._listeners)
+        for callback in listeners:
+            callback(self)
+
+    def subscribe(self, callback):
+        """Call `callback(job)` after every status change, from the thread making it."""
+        with self.changed:
+            self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        with self.changed:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def wait_for_change(self, seen_version, timeout):
+        """Block until the job changes past `seen_version`; returns the current version."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != seen_version, timeout)
+            return self.version
+
+    def wait(self, timeout=None):
+        """Block until the job reaches a terminal status; returns False on timeout."""
+        with self.changed:
+            return self.changed.wait_for(lambda: self.finished, timeout)
+
+    def to_dict(self):
+        image_paths = [f"generated/{os.path.basename(path)}" for path in self.images]
+        return {
+            'jobId': self.id,
+            'status': self.status,
+            'error': self.error,
+            'promptId': self.prompt_id,
+            'backend': self.backend,
+            'seed': self.seed,
+            'cached': self.cached,
+            'coalesced': self.coalesced,
+            'createdAt': self.created_at,
+            'startedAt': self.started_at,
+            'finishedAt': self.finished_at,
+            'generatedImagePaths': image_paths,
+        }
+
+
+class JobManager:
+    """Runs submitted jobs on a small pool of worker threads behind a bounded queue."""
+
+    def __init__(self, client, max_queue_size=16, workers=2, result_cache=None, generated_folder=None,
+                 batch_window=0, max_batch_size=1, workflows=None, retention=None, thumbnails=None):
+        self.client = client
+        # RetentionManager; outputs of unfinished jobs are pinned by job id
+        self.retention = retention
+        # ThumbnailService; renders the preview of each job's first image
+        self.thumbnails = thumbnails
+        # WorkflowRegistry; template hashes are part of result-cache keys
+        self.workflows = workflows
+        self.result_cache = result_cache
+        self.generated_folder = generated_folder
+        self.max_queue_size = max_queue_size
+        self.workers = workers
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._jobs = OrderedDict()
+        # Single-flight indexes: request fingerprint -> in-flight job, and
+        # client idempotency key -> job
+        self._inflight = {}
+        self._by_idempotency_key = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        JOB_QUEUE_DEPTH.set_function(self.queue_depth)
+
+    def start(self):
+        """Start the worker threads (idempotent)."""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, params):
+        """Queue a job; returns the Job, or None if the queue is full.
+
+        Single-flight: a request with the same idempotency key as an earlier
+        job, or with the same images, prompts and seed as a job still in
+        flight, is attached to that job instead of queuing a duplicate.
+        Reusing a key for a different request raises IdempotencyConflict; a
+        key whose job failed starts a new run.
+        Requests with an explicit seed that were generated before are answered
+        from the result cache without being queued.
+        """
+        self.start()
+        fingerprint = self._fingerprint(params)
+        idempotency_key = params.get('idempotency_key')
+
+        with self._lock:
+            existing = self._find_existing(fingerprint, idempotency_key)
+        if existing is not None:
+            return self._attach(existing)
+
+        job = Job(params)
+        job.fingerprint = fingerprint
+        if self._serve_from_cache(job):
+            JOBS_IN_FLIGHT.inc()
+            with self._lock:
+                self._publish(job, idempotency_key)
+            self._release(job)
+            return job
+
+        queued = False
+        with self._lock:
+            # A duplicate may have been queued while we checked the cache
+            existing = self._find_existing(fingerprint, idempotency_key)
+            if existing is None:
+                JOBS_IN_FLIGHT.inc()
+                if self.retention is not None:
+                    self.retention.pin(job.id)
+                try:
+                    self._queue.put_nowait(job)
+                except queue.Full:
+                    print(f"[JOBS] Queue full ({self.max_queue_size}), rejecting job")
+                else:
+                    # Only a queued job is published, so duplicates never
+                    # attach to one that will not run
+                    queued = True
+                    self._publish(job, idempotency_key)
+                    if fingerprint:
+                        self._inflight[fingerprint] = job
+        if existing is not None:
+            return self._attach(existing)
+        if not queued:
+            self._release(job)
+            return None
+        return job
+
+    def _attach(self, existing):
+        existing.update(coalesced=existing.coalesced + 1)
+        JOBS_TOTAL.inc(outcome='coalesced')
+        return existing
+
+    def _publish(self, job, idempotency_key):
+        """Make a job visible to GET /jobs/<id> and to retries with its key (call with the lock held)."""
+        self._jobs[job.id] = job
+        if idempotency_key:
+            self._by_idempotency_key[idempotency_key] = job
+        self._trim()
+
+    def _fingerprint(self, params):
+        """Identity of a request for coalescing: image hashes, prompts, seed and template."""
+        try:
+            digests = [file_digest(path) for path in params['images']]
+        except OSError:
+            return None
+        parts = [digests, params['positive_prompt'], params['negative_prompt'], params.get('seed'),
+                 self._template_hash(params)]
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def _find_existing(self, fingerprint, idempotency_key):
+        """Return the job a new request should attach to, if any (call with the lock held)."""
+        if idempotency_key:
+            job = self._by_idempotency_key.get(idempotency_key)
+            # A failed job is not the answer to a retry: run it again
+            if job is not None and job.status != 'error':
+                if job.fingerprint != fingerprint:
+                    raise IdempotencyConflict(f"Idempotency key {idempotency_key!r} was used for a different request")
+                # Retries with the same key get the original job, running or done
+                return job
+        if fingerprint:
+            job = self._inflight.get(fingerprint)
+            if job is not None and not job.finished:
+                return job
+        return None
+
+    def _release(self, job):
+        """Stop coalescing new requests onto a finished (or rejected) job, unpin its outputs and record it."""
+        with self._lock:
+            if job.fingerprint and self._inflight.get(job.fingerprint) is job:
+                del self._inflight[job.fingerprint]
+        if self.retention is not None:
+            self.retention.unpin(job.id)
+
+        JOBS_IN_FLIGHT.dec()
+        if not job.finished:
+            JOBS_TOTAL.inc(outcome='rejected')
+            return
+        JOBS_TOTAL.inc(outcome='cached' if job.cached else job.status)
+        STAGE_SECONDS.observe(job.finished_at - job.created_at, stage='end_to_end')
+
+    def _template_hash(self, params):
+        if self.workflows is None:
+            return None
+        try:
+            return self.workflows.get(params.get('template')).hash
+        except KeyError:
+            return None
+
+    def _cache_key(self, params, seed):
+        if self.result_cache is None or seed is None:
+            return None
+        template_hash = self._template_hash(params)
+        if template_hash is None:
+            return None
+        try:
+            digests = [file_digest(path) for path in params['images']]
+        except OSError:
+            return None
+        return result_key(digests, params['positive_prompt'], params['negative_prompt'], seed, template_hash)
+
+    def _serve_from_cache(self, job):
+        key = self._cache_key(job.params, job.params.get('seed'))
+        if key is None:
+            return False
+        stored = self.result_cache.get(key)
+        if not stored:
+            return False
+        try:
+            images = self.result_cache.materialize(stored, self.generated_folder, job.id)
+        except OSError as e:
+            print(f"[JOBS] Cached result {key} unusable: {e}")
+            return False
+        if self.retention is not None:
+            for path in images:
+                self.retention.track('generated', path)
+        self._prewarm_preview(images)
+        now = time.time()
+        job.update(status='done', cached=True, images=images, started_at=now, finished_at=now)
+        return True
+
+    def _store_result(self, job, result):
+        # Store under the seed actually used, so a later request naming it hits
+        key = self._cache_key(job.params, result.get('seed'))
+        if key is not None:
+            self.result_cache.put(key, result['images'])
+
+    def _prewarm_preview(self, images):
+        if self.thumbnails is not None and images:
+            self.thumbnails.prewarm(images[0])
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _trim(self):
+        """Forget the oldest finished jobs once too many are kept."""
+        if len(self._jobs) <= MAX_FINISHED_JOBS:
+            return
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= MAX_FINISHED_JOBS:
+                break
+            job = self._jobs[job_id]
+            if job.finished:
+                del self._jobs[job_id]
+                key = job.params.get('idempotency_key')
+                if key and self._by_idempotency_key.get(key) is job:
+                    del self._by_idempotency_key[key]
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                if len(batch) == 1:
+                    self._run(batch[0])
+                else:
+                    self._run_batch(batch)
+            finally:
+                for job in batch:
+                    self._release(job)
+                    self._queue.task_done()
+
+    def _next_batch(self):
+        """Block for one job, then collect the jobs arriving within the batch window."""
+        batch = [self._queue.get()]
+        deadline = time.time() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, job):
+        job.update(status='running', started_at=time.time())
+        STAGE_SECONDS.observe(job.started_at - job.created_at, stage='queue_wait')
+        params = job.params
+        try:
+            result = self.client.generate(
+                params['images'][0],
+                params['images'][1],
+                params['positive_prompt'],
+                params['negative_prompt'],
+                params.get('seed'),
+                params.get('template'),
+                job.id,
+            )
+            # Inside the try: a failing cache store or preview must not kill the worker
+            self._finish(job, result)
+        except Exception as e:
+            print(f"[JOBS] Job {job.id} crashed: {e}")
+            if not job.finished:
+                job.update(status='error', error=str(e), finished_at=time.time())
+
+    def _run_batch(self, batch):
+        started = time.time()
+        for job in batch:
+            job.update(status='running', started_at=started)
+            STAGE_SECONDS.observe(started - job.created_at, stage='queue_wait')
+        try:
+            # Each job finishes as soon as its own prompt is done
+            self.client.generate_batch([dict(job.params, job_id=job.id) for job in batch],
+                                       on_result=lambda index, result: self._finish(batch[index], result))
+        except Exception as e:
+            print(f"[JOBS] Batch crashed: {e}")
+            for job in batch:
+                if not job.finished:
+                    job.update(status='error', error=str(e), finished_at=time.time())
+
+    def _finish(self, job, result):
+        if result['success']:
+            # Store first, so a repeat request made once this job is done hits the cache
+            self._store_result(job, result)
+            self._prewarm_preview(result['images'])
+            job.update(status='done', prompt_id=result['prompt_id'], backend=result.get('backend'),
+                       seed=result.get('seed'), images=result['images'], finished_at=time.time())
+        else:
+            job.update(status='error', prompt_id=result['prompt_id'], backend=result.get('backend'),
+                       error=result['error'], finished_at=time.time())
+            print(f"[JOBS] Job {job.id} failed: {result['error']}")
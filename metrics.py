@@ -0,0 +1,206 @@
+"""In-process metrics exported in the Prometheus text format at GET /metrics.
+
+Recording is a lock, a dict lookup and (for histograms) a bisect, cheap
+enough to stay on in production; the text is only rendered when scraped.
+The generation pipeline records every stage into one histogram labelled by
+`stage`:
+
+    upload_save   storing an uploaded reference image
+    staging       getting a job's reference images onto its backend
+    submit        POST /prompt
+    queue_wait    time a job spent in the in-process queue
+    execution     from submission until ComfyUI reported the prompt done
+    history       looking up a finished prompt's outputs in /history
+    download      one output image streamed from /view
+    end_to_end    job submission until it finished (including cache hits)
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; generations take seconds to minutes, file work milliseconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metric:
+    """Base class: one metric family with optional labels."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values -> value (or histogram state)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._callback = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, callback):
+        """Read the (unlabelled) value from `callback()` at scrape time instead."""
+        self._callback = callback
+
+    def render(self):
+        if self._callback is not None:
+            with self._lock:
+                self._values[()] = self._callback()
+        return super().render()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self, key, state):
+        counts, total, count = state[0][:], state[1], state[2]
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            labels = format_labels(self.labelnames, key, [('le', format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """The exposition text served at /metrics."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'generation_stage_seconds', 'Duration of each generation pipeline stage.', ['stage']))
+STAGE_FAILURES = REGISTRY.register(Counter(
+    'generation_stage_failures_total', 'Pipeline stages that failed.', ['stage']))
+JOBS_TOTAL = REGISTRY.register(Counter(
+    'generation_jobs_total', 'Jobs by outcome (done, error, cached, rejected, coalesced).', ['outcome']))
+JOBS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'generation_jobs_in_flight', 'Jobs accepted and not yet finished.'))
+JOB_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'generation_job_queue_depth', 'Jobs waiting in the in-process queue.'))
+BACKEND_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'comfyui_backend_queue_depth', 'Prompts running or pending on a ComfyUI backend at the last health check.',
+    ['backend']))
+BACKEND_HEALTHY = REGISTRY.register(Gauge(
+    'comfyui_backend_healthy', '1 if the backend passed its last health check.', ['backend']))
+
+
+@contextmanager
+def stage_timer(stage):
+    """Time a pipeline stage; exceptions are counted as failures of the stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_FAILURES.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+
+def render():
+    return REGISTRY.render()
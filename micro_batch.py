@@ -0,0 +1,110 @@
+"""Merging of several generation graphs into one ComfyUI prompt.
+
+Jobs built from the same template differ only in their reference images,
+prompts, seed and output prefix. Submitting them as one prompt lets ComfyUI
+validate and schedule once and load the shared loader chain once, instead of
+paying the full per-prompt overhead for every job.
+
+Nodes are merged by content: a node whose class, literal inputs and
+(recursively) upstream nodes are identical in two graphs is kept once, so
+checkpoint/VAE/IP-Adapter/CLIP vision loaders and the empty latent are shared
+while each job keeps its own conditioning, sampler and SaveImage branch.
+Outputs are split back per job by the SaveImage filename prefix.
+"""
+import hashlib
+import json
+
+# Node classes whose literal inputs must match for jobs to share a prompt,
+# with the inputs that may differ per job
+BATCH_KEY_CLASSES = {
+    'CheckpointLoaderSimple': (),
+    'KSampler': ('seed',),
+    'KSamplerAdvanced': ('noise_seed',),
+    'EmptyLatentImage': (),
+}
+
+
+def is_link(value):
+    """True for a node input that references another node's output: [node_id, index]."""
+    return (isinstance(value, list) and len(value) == 2
+            and isinstance(value[0], str) and isinstance(value[1], int))
+
+
+def batch_key(workflow):
+    """Compatibility key: checkpoint, sampler settings (except the seed) and resolution."""
+    parts = []
+    for node in workflow.values():
+        ignored = BATCH_KEY_CLASSES.get(node.get('class_type'))
+        if ignored is None:
+            continue
+        inputs = {name: value for name, value in node['inputs'].items()
+                  if name not in ignored and not is_link(value)}
+        parts.append(json.dumps([node['class_type'], inputs], sort_keys=True))
+    return hashlib.sha256(json.dumps(sorted(parts)).encode()).hexdigest()
+
+
+def node_signatures(workflow, unique=()):
+    """Content hash of every node, covering its class, literal inputs and upstream nodes.
+
+    Nodes in `unique` (and everything downstream of them) never hash equal to
+    another node, e.g. template nodes whose inputs are only filled in later.
+    """
+    signatures = {}
+
+    def signature(node_id):
+        if node_id in signatures:
+            return signatures[node_id]
+        node = workflow[node_id]
+        inputs = {}
+        for name, value in node['inputs'].items():
+            if is_link(value) and value[0] in workflow:
+                inputs[name] = ['link', signature(value[0]), value[1]]
+            else:
+                inputs[name] = value
+        parts = [node['class_type'], inputs]
+        if node_id in unique:
+            parts.append(node_id)
+        signatures[node_id] = hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+        return signatures[node_id]
+
+    for node_id in workflow:
+        signature(node_id)
+    return signatures
+
+
+def merge_workflows(workflows):
+    """Combine API-format graphs into one, sharing identical nodes.
+
+    The first graph keeps its node ids; nodes only present in later graphs are
+    renamed `<id>_<index>` when their id is taken.
+    """
+    merged = {}
+    by_signature = {}
+    for index, workflow in enumerate(workflows):
+        signatures = node_signatures(workflow)
+
+        renamed = {}
+        new_nodes = []
+        for node_id in workflow:
+            shared_id = by_signature.get(signatures[node_id])
+            if shared_id is not None:
+                renamed[node_id] = shared_id
+                continue
+            new_id = node_id if node_id not in merged else f"{node_id}_{index}"
+            suffix = 1
+            while new_id in merged:
+                new_id = f"{node_id}_{index}_{suffix}"
+                suffix += 1
+            merged[new_id] = None  # reserve the id until the node is copied
+            by_signature[signatures[node_id]] = new_id
+            renamed[node_id] = new_id
+            new_nodes.append((node_id, new_id))
+
+        for node_id, new_id in new_nodes:
+            node = workflow[node_id]
+            inputs = {
+                name: [renamed[value[0]], value[1]] if is_link(value) and value[0] in renamed else value
+                for name, value in node['inputs'].items()
+            }
+            merged[new_id] = dict(node, inputs=inputs)
+    return merged
@@ -0,0 +1,116 @@
+"""Model-residency policy for a ComfyUI backend.
+
+Models stay loaded across jobs; `/free` is only called when the backend
+reports memory pressure through `/system_stats` or when the workflow's
+checkpoints change.
+"""
+import threading
+
+CHECKPOINT_LOADER_CLASSES = ('CheckpointLoaderSimple', 'CheckpointLoader')
+
+
+class ModelResidencyPolicy:
+    """Decides before each submission whether ComfyUI should unload models or free memory.
+
+    mode:
+      'auto'   - keep models warm, free only above the VRAM/RAM thresholds or
+                 when the checkpoint changes (default)
+      'never'  - never call /free
+      'always' - unload models before every job (the old behaviour, minus the
+                 queue interrupt)
+    """
+
+    MODES = ('auto', 'never', 'always')
+
+    def __init__(self, http, mode='auto', vram_threshold=0.90, ram_threshold=0.90):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown model residency mode: {mode}")
+        # The backend's ComfyUIHttp session
+        self.http = http
+        self.mode = mode
+        self.vram_threshold = vram_threshold
+        self.ram_threshold = ram_threshold
+        self._last_checkpoint = None
+        self._lock = threading.Lock()
+
+    def get_system_stats(self):
+        """Fetch /system_stats, or None if the backend does not answer."""
+        try:
+            response = self.http.get("/system_stats", timeout=5)
+            if response.status_code == 200:
+                return response.json()
+            print(f"[RESIDENCY] /system_stats returned {response.status_code}")
+        except Exception as e:
+            print(f"[RESIDENCY] Failed to read /system_stats: {e}")
+        return None
+
+    @staticmethod
+    def memory_usage(stats):
+        """Return (vram_used_fraction, ram_used_fraction) from a /system_stats document."""
+        vram_used = 0.0
+        for device in stats.get('devices', []):
+            total = device.get('vram_total') or 0
+            if total:
+                vram_used = max(vram_used, 1 - (device.get('vram_free') or 0) / total)
+
+        system = stats.get('system', {})
+        ram_total = system.get('ram_total') or 0
+        ram_used = 1 - (system.get('ram_free') or 0) / ram_total if ram_total else 0.0
+        return vram_used, ram_used
+
+    def free(self, unload_models=False, free_memory=False):
+        """POST /free. ComfyUI applies it between prompts, so running jobs are not interrupted."""
+        try:
+            response = self.http.post(
+                "/free",
+                json={"unload_models": unload_models, "free_memory": free_memory},
+                timeout=5
+            )
+            if response.status_code == 200:
+                print(f"[RESIDENCY] Requested /free (unload_models={unload_models}, free_memory={free_memory})")
+                return True
+            print(f"[RESIDENCY] /free failed: {response.status_code}")
+        except Exception as e:
+            print(f"[RESIDENCY] /free failed: {e}")
+        return False
+
+    def before_submit(self, workflow):
+        """Apply the policy for the workflow about to be queued. Returns the action taken."""
+        # Workflow templates may use different checkpoints
+        checkpoint = ', '.join(sorted(
+            str(node['inputs'].get('ckpt_name'))
+            for node in workflow.values()
+            if node.get('class_type') in CHECKPOINT_LOADER_CLASSES
+        )) or None
+
+        with self._lock:
+            previous = self._last_checkpoint
+            self._last_checkpoint = checkpoint
+
+        if self.mode == 'never':
+            return None
+
+        if self.mode == 'always':
+            self.free(unload_models=True)
+            return 'unload_models'
+
+        if previous is not None and checkpoint != previous:
+            print(f"[RESIDENCY] Checkpoint changed: {previous} -> {checkpoint}")
+            self.free(unload_models=True)
+            return 'unload_models'
+
+        stats = self.get_system_stats()
+        if not stats:
+            return None
+
+        vram_used, ram_used = self.memory_usage(stats)
+        if vram_used > self.vram_threshold:
+            print(f"[RESIDENCY] VRAM usage {vram_used:.0%} above {self.vram_threshold:.0%}")
+            self.free(unload_models=True)
+            return 'unload_models'
+        if ram_used > self.ram_threshold:
+            print(f"[RESIDENCY] RAM usage {ram_used:.0%} above {self.ram_threshold:.0%}")
+            self.free(free_memory=True)
+            return 'free_memory'
+
+        return None
@@ -0,0 +1,140 @@
+"""Deterministic cache of finished generations.
+
+With a fixed seed the workflow is deterministic, so a request is fully
+described by the reference-image hashes, both prompts, the seed and the
+workflow template. Finished outputs are stored under that key; a repeated
+request is answered from disk without touching ComfyUI.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+from content_store import replace_with_link
+
+
+def result_key(image_digests, positive_prompt, negative_prompt, seed, template_hash):
+    parts = [list(image_digests), positive_prompt, negative_prompt, int(seed), template_hash]
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+def link_or_copy(src, dst):
+    """Hard-link when possible (same filesystem), otherwise copy."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class ResultCache:
+    """Stores output images per request key with a disk budget and LRU eviction."""
+
+    def __init__(self, folder, max_bytes=2 * 1024 * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (files, size), least recently used first
+        self._total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load_index()
+
+    def _load_index(self):
+        """Build the in-memory index once; recency is approximated by directory mtime."""
+        os.makedirs(self.folder, exist_ok=True)
+        found = []
+        for key in os.listdir(self.folder):
+            entry_dir = os.path.join(self.folder, key)
+            if not os.path.isdir(entry_dir) or key.endswith('.tmp'):
+                continue
+            files = sorted(f for f in os.listdir(entry_dir) if not f.startswith('.'))
+            if not files:
+                continue
+            size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in files)
+            found.append((os.path.getmtime(entry_dir), key, files, size))
+        for _, key, files, size in sorted(found):
+            self._entries[key] = (files, size)
+            self._total += size
+        if found:
+            print(f"[RESULTS] Loaded {len(found)} cached results ({self._total} bytes)")
+
+    def get(self, key):
+        """Return the stored output paths for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        entry_dir = os.path.join(self.folder, key)
+        try:
+            os.utime(entry_dir)
+        except OSError:
+            pass
+        return [os.path.join(entry_dir, f) for f in entry[0]]
+
+    def put(self, key, image_paths):
+        """Store copies of a finished job's outputs under key."""
+        entry_dir = os.path.join(self.folder, key)
+        if os.path.isdir(entry_dir):
+            return
+
+        tmp_dir = f"{entry_dir}.{threading.get_ident()}.tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        files = []
+        size = 0
+        try:
+            for i, path in enumerate(image_paths):
+                name = f"{i:02d}{os.path.splitext(path)[1]}"
+                link_or_copy(path, os.path.join(tmp_dir, name))
+                files.append(name)
+                size += os.path.getsize(path)
+            os.replace(tmp_dir, entry_dir)
+        except OSError as e:
+            print(f"[RESULTS] Failed to store result {key}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        evicted = []
+        with self._lock:
+            self._entries[key] = (files, size)
+            self._total += size
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                old_key, (_, old_size) = self._entries.popitem(last=False)
+                self._total -= old_size
+                evicted.append(old_key)
+
+        for old_key in evicted:
+            shutil.rmtree(os.path.join(self.folder, old_key), ignore_errors=True)
+            print(f"[RESULTS] Evicted {old_key}")
+
+    def materialize(self, stored_paths, generated_folder, job_id):
+        """Expose cached outputs in the generated folder under names tagged with job_id; returns their paths."""
+        os.makedirs(generated_folder, exist_ok=True)
+        current_timestamp = int(time.time())
+        paths = []
+        for i, src in enumerate(stored_paths):
+            dst_name = f"generated_{current_timestamp}_{i}_cached_{job_id}{os.path.splitext(src)[1]}"
+            dst_path = os.path.join(generated_folder, dst_name)
+            link_or_copy(src, dst_path)
+            paths.append(dst_path)
+
+        # Keep latest_image.png pointing at the newest result, as downloads do
+        if paths:
+            replace_with_link(paths[0], os.path.join(generated_folder, 'latest_image.png'))
+        return paths
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,194 @@
+"""Background retention for generated outputs and staged ComfyUI inputs.
+
+Each managed area is a folder plus the file name prefixes this process
+writes there, with a byte budget and a maximum age. The folder is scanned
+once when the area is added; after that writers report new files with
+track() / touch() and the janitor thread works from the in-memory index,
+evicting the least recently used files first.
+
+Files are never evicted while pinned: a pin is a tag (e.g. a job id, which
+output names carry) matched against file names. Files used within an area's
+`min_age` are also kept, which protects staged inputs of prompts still in
+ComfyUI's queue.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class RetentionArea:
+    """Index of the managed files in one folder, least recently used first."""
+
+    def __init__(self, name, folder, prefixes, max_bytes=None, max_age=None, min_age=0):
+        self.name = name
+        self.folder = folder
+        self.prefixes = tuple(prefixes)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.min_age = min_age
+        self.files = OrderedDict()  # path -> [size, last_used]
+        self.total = 0
+        self.evicted = 0
+        self.listeners = []
+
+    def manages(self, path):
+        return os.path.basename(path).startswith(self.prefixes)
+
+    def scan(self):
+        """Seed the index from disk (once, when the area is added)."""
+        if not os.path.isdir(self.folder):
+            return
+        found = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if self.manages(path) and os.path.isfile(path):
+                stat = os.stat(path)
+                found.append((stat.st_mtime, path, stat.st_size))
+        for mtime, path, size in sorted(found):
+            self.files[path] = [size, mtime]
+            self.total += size
+
+    def add(self, path, size, used_at):
+        if path in self.files:
+            self.total -= self.files[path][0]
+        self.files[path] = [size, used_at]
+        self.files.move_to_end(path)
+        self.total += size
+
+
+class RetentionManager:
+    """Janitor thread enforcing size budgets and maximum ages on registered areas."""
+
+    def __init__(self, interval=60):
+        self.interval = interval
+        self._areas = {}
+        self._pins = {}  # tag -> count
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add_area(self, name, folder, prefixes, max_bytes=None, max_age=None, min_age=0):
+        """Manage files starting with `prefixes` in `folder` (idempotent per name)."""
+        with self._lock:
+            if name in self._areas:
+                return self._areas[name]
+        area = RetentionArea(name, folder, prefixes, max_bytes, max_age, min_age)
+        area.scan()
+        with self._lock:
+            self._areas.setdefault(name, area)
+        print(f"[RETENTION] Managing {name}: {len(area.files)} files, {area.total} bytes in {folder}")
+        return area
+
+    def on_evict(self, name, callback):
+        """Call `callback(path)` after a file of area `name` was deleted."""
+        with self._lock:
+            area = self._areas.get(name)
+            if area is not None:
+                area.listeners.append(callback)
+
+    def track(self, name, path):
+        """Record a newly written file (or mark an existing one as used)."""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self._lock:
+            area = self._areas.get(name)
+            if area is not None and area.manages(path):
+                area.add(path, size, time.time())
+
+    def touch(self, name, path):
+        """Mark a file as used now; unknown files are tracked."""
+        with self._lock:
+            area = self._areas.get(name)
+            if area is None:
+                return
+            entry = area.files.get(path)
+            if entry is not None:
+                entry[1] = time.time()
+                area.files.move_to_end(path)
+                return
+        self.track(name, path)
+
+    def pin(self, tag):
+        with self._lock:
+            self._pins[tag] = self._pins.get(tag, 0) + 1
+
+    def unpin(self, tag):
+        with self._lock:
+            count = self._pins.get(tag, 0) - 1
+            if count > 0:
+                self._pins[tag] = count
+            else:
+                self._pins.pop(tag, None)
+
+    def start(self):
+        """Start the janitor thread (idempotent)."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="retention", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[RETENTION] Sweep failed: {e}")
+
+    def _pinned(self, path):
+        name = os.path.basename(path)
+        return any(tag in name for tag in self._pins)
+
+    def sweep(self):
+        """Evict expired files, then least recently used ones while an area is over budget."""
+        now = time.time()
+        doomed = []
+        with self._lock:
+            for area in self._areas.values():
+                victims = []
+                remaining = area.total
+                for path, (size, used_at) in area.files.items():
+                    age = now - used_at
+                    if age < area.min_age or self._pinned(path):
+                        continue
+                    expired = area.max_age is not None and age > area.max_age
+                    over_budget = area.max_bytes is not None and remaining > area.max_bytes
+                    if not expired and not over_budget:
+                        # Ordered by last use: nothing newer is expired either
+                        break
+                    victims.append(path)
+                    remaining -= size
+                for path in victims:
+                    area.total -= area.files.pop(path)[0]
+                    area.evicted += 1
+                    doomed.append((area, path))
+
+        for area, path in doomed:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[RETENTION] Could not delete {path}: {e}")
+                continue
+            for callback in area.listeners:
+                callback(path)
+        if doomed:
+            print(f"[RETENTION] Evicted {len(doomed)} files")
+        return len(doomed)
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    'files': len(area.files),
+                    'bytes': area.total,
+                    'max_bytes': area.max_bytes,
+                    'max_age': area.max_age,
+                    'evicted': area.evicted,
+                }
+                for name, area in self._areas.items()
+            }
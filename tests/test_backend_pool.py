@@ -0,0 +1,160 @@
+"""BackendPool scheduling and failover against fake ComfyUI servers.
+
+Starts fake_comfyui_server.py subprocesses: an idle backend, an overloaded
+one (prompts already queued) and an address nobody listens on.
+
+    python -m pytest tests
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import requests
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backend_pool import BackendPool  # noqa: E402
+from comfyui_client import ComfyUIClient  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_fake_server(port, delay):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'fake_comfyui_server.py'), '--port', str(port),
+         '--delay', str(delay), '--batch', '1'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"fake ComfyUI server on port {port} did not start")
+
+
+class BackendPoolTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.idle_port = free_port()
+        cls.busy_port = free_port()
+        cls.dead_port = free_port()
+        cls.servers = [start_fake_server(cls.idle_port, 0.2), start_fake_server(cls.busy_port, 60)]
+        # Fill the busy backend's queue with prompts that will not finish during the test
+        for _ in range(3):
+            requests.post(f"http://127.0.0.1:{cls.busy_port}/prompt", json={'prompt': {}}, timeout=5)
+
+        cls.folder = tempfile.mkdtemp()
+        cls.images = []
+        for name, color in (('a.png', 'red'), ('b.png', 'blue')):
+            path = os.path.join(cls.folder, name)
+            Image.new('RGB', (64, 64), color).save(path)
+            cls.images.append(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        for process in cls.servers:
+            process.kill()
+            process.wait()
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def make_pool(self, *ports):
+        clients = [
+            ComfyUIClient(
+                server_address=f"127.0.0.1:{port}",
+                generated_folder=os.path.join(self.folder, 'generated'),
+                history_poll_interval=0.2,
+                job_timeout=30,
+                http_retries=0,
+            )
+            for port in ports
+        ]
+        pool = BackendPool(clients)
+        # No background health checks: each test decides when the pool refreshes
+        pool.start = lambda: None
+        return pool
+
+    def request(self, seed):
+        return {'images': self.images, 'positive_prompt': 'a cat', 'negative_prompt': 'blurry', 'seed': seed}
+
+    def test_choose_prefers_shorter_queue(self):
+        pool = self.make_pool(self.busy_port, self.idle_port)
+        pool.refresh()
+        busy, idle = pool.backends
+        self.assertEqual(busy.queue_depth, 3)
+        self.assertEqual(idle.queue_depth, 0)
+
+        backend = pool.choose()
+        self.assertIs(backend, idle)
+        pool.release(backend)
+
+    def test_choose_skips_unhealthy_backend(self):
+        pool = self.make_pool(self.dead_port, self.idle_port)
+        pool.refresh()
+        dead, idle = pool.backends
+        self.assertFalse(dead.healthy)
+
+        backend = pool.choose()
+        self.assertIs(backend, idle)
+        pool.release(backend)
+        self.assertIsNone(pool.choose(exclude=[idle]))
+
+    def test_generate_runs_on_least_loaded_backend(self):
+        pool = self.make_pool(self.busy_port, self.idle_port)
+        pool.refresh()
+        result = pool.generate(*self.images, 'a cat', 'blurry', seed=1)
+        self.assertTrue(result['success'], result['error'])
+        self.assertEqual(result['backend'], f"127.0.0.1:{self.idle_port}")
+        self.assertEqual(len(result['images']), 1)
+
+    def test_generate_fails_over_from_dead_backend(self):
+        # Not refreshed: the dead backend still looks healthy and is picked first
+        pool = self.make_pool(self.dead_port, self.idle_port)
+        dead, idle = pool.backends
+        result = pool.generate(*self.images, 'a cat', 'blurry', seed=2)
+        self.assertTrue(result['success'], result['error'])
+        self.assertEqual(result['backend'], idle.address)
+        self.assertFalse(dead.healthy)
+        self.assertEqual(dead.active_jobs, 0)
+        self.assertEqual(idle.active_jobs, 0)
+
+    def test_generate_batch_fails_over_from_dead_backend(self):
+        pool = self.make_pool(self.dead_port, self.idle_port)
+        dead, idle = pool.backends
+        reported = {}
+        results = pool.generate_batch([self.request(3), self.request(4)],
+                                      on_result=lambda index, result: reported.setdefault(index, result))
+        for result in results:
+            self.assertTrue(result['success'], result['error'])
+            self.assertEqual(result['backend'], idle.address)
+        self.assertFalse(dead.healthy)
+        # Retryable failures on the dead backend are not reported as final
+        self.assertEqual(sorted(reported), [0, 1])
+        self.assertTrue(all(result['success'] for result in reported.values()))
+
+    def test_generate_without_healthy_backend(self):
+        pool = self.make_pool(self.dead_port)
+        pool.refresh()
+        result = pool.generate(*self.images, 'a cat', 'blurry', seed=5)
+        self.assertFalse(result['success'])
+        self.assertTrue(result['retryable'])
+        self.assertIsNone(result['backend'])
+
+
+if __name__ == '__main__':
+    unittest.main()
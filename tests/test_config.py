@@ -0,0 +1,103 @@
+"""Setting overrides from the environment and config files (config.py).
+
+    python -m pytest tests
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import Config, coerce_setting  # noqa: E402
+
+
+class CoerceSettingTest(unittest.TestCase):
+
+    def test_int_default(self):
+        self.assertEqual(coerce_setting('4', 2), 4)
+        self.assertIsInstance(coerce_setting('4', 2), int)
+
+    def test_int_default_accepts_fraction(self):
+        self.assertEqual(coerce_setting('2.5', 30), 2.5)
+        self.assertEqual(coerce_setting('0.5', 1), 0.5)
+
+    def test_int_default_rejects_garbage(self):
+        with self.assertRaises(ValueError):
+            coerce_setting('fast', 30)
+
+    def test_float_default(self):
+        self.assertEqual(coerce_setting('1', 0.2), 1.0)
+        self.assertIsInstance(coerce_setting('1', 0.2), float)
+
+    def test_bool_default(self):
+        for value in ('1', 'true', 'Yes', ' on '):
+            self.assertIs(coerce_setting(value, False), True)
+        for value in ('0', 'false', 'off', ''):
+            self.assertIs(coerce_setting(value, True), False)
+
+    def test_list_default(self):
+        self.assertEqual(coerce_setting('10.0.0.5:8188, 10.0.0.6:8188', ['127.0.0.1:8188']),
+                         ['10.0.0.5:8188', '10.0.0.6:8188'])
+        self.assertEqual(coerce_setting('["a", "b"]', ['x']), ['a', 'b'])
+        self.assertEqual(coerce_setting('1,2', [0]), [1, 2])
+
+    def test_json_values_are_not_converted(self):
+        # Values from the config file already have their JSON type
+        self.assertEqual(coerce_setting(2.5, 30), 2.5)
+        self.assertIs(coerce_setting(False, True), False)
+
+    def test_string_and_none_defaults(self):
+        self.assertEqual(coerce_setting('websocket', 'history'), 'websocket')
+        self.assertEqual(coerce_setting('/data/input', None), '/data/input')
+
+
+class ConfigOverridesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write_config_file(self, settings):
+        path = os.path.join(self.folder, 'config.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(settings, f)
+        return path
+
+    def test_environment_overrides(self):
+        config = Config(environ={
+            'JOB_WORKERS': '4',
+            'COMFYUI_READ_TIMEOUT': '2.5',
+            'COMFYUI_SERVERS': '10.0.0.5:8188,10.0.0.6:8188',
+            'RESULT_CACHE_ENABLED': 'false',
+            'UNRELATED': 'ignored',
+        })
+        self.assertEqual(config.JOB_WORKERS, 4)
+        self.assertEqual(config.COMFYUI_READ_TIMEOUT, 2.5)
+        self.assertEqual(config.COMFYUI_SERVERS, ['10.0.0.5:8188', '10.0.0.6:8188'])
+        self.assertEqual(config.COMFYUI_HTTP, 'http://10.0.0.5:8188')
+        self.assertIs(config.RESULT_CACHE_ENABLED, False)
+
+    def test_environment_wins_over_config_file(self):
+        path = self.write_config_file({'JOB_WORKERS': 3, 'JOB_BATCH_WINDOW': 0.5})
+        config = Config(environ={'JOB_WORKERS': '6'}, config_file=path)
+        self.assertEqual(config.JOB_WORKERS, 6)
+        self.assertEqual(config.JOB_BATCH_WINDOW, 0.5)
+
+    def test_invalid_value_names_the_setting(self):
+        with self.assertRaisesRegex(ValueError, 'JOB_WORKERS'):
+            Config(environ={'JOB_WORKERS': 'many'})
+
+    def test_unknown_setting_in_config_file(self):
+        path = self.write_config_file({'JOB_WROKERS': 3})
+        with self.assertRaisesRegex(ValueError, 'Unknown setting: JOB_WROKERS'):
+            Config(environ={}, config_file=path)
+
+
+if __name__ == '__main__':
+    unittest.main()
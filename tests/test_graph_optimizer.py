@@ -0,0 +1,92 @@
+"""Duplicate merging and dead-node pruning (graph_optimizer.py).
+
+    python -m pytest tests
+"""
+import copy
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from graph_optimizer import describe_report, optimize_workflow, output_classes_from_object_info  # noqa: E402
+
+
+def make_workflow():
+    """Graph with an unused VAELoader and a second, identical checkpoint loader."""
+    return {
+        '4': {'class_type': 'CheckpointLoaderSimple', 'inputs': {'ckpt_name': 'model.safetensors'}},
+        '14': {'class_type': 'CheckpointLoaderSimple', 'inputs': {'ckpt_name': 'model.safetensors'}},
+        '45': {'class_type': 'VAELoader', 'inputs': {'vae_name': 'vae.safetensors'}},
+        '5': {'class_type': 'EmptyLatentImage', 'inputs': {'width': 512, 'height': 512, 'batch_size': 1}},
+        '6': {'class_type': 'CLIPTextEncode', 'inputs': {'text': 'a cat', 'clip': ['4', 1]}},
+        '7': {'class_type': 'CLIPTextEncode', 'inputs': {'text': 'blurry', 'clip': ['14', 1]}},
+        '3': {'class_type': 'KSampler', 'inputs': {
+            'seed': 1, 'steps': 20, 'cfg': 7, 'sampler_name': 'euler', 'scheduler': 'normal',
+            'denoise': 1, 'model': ['14', 0], 'positive': ['6', 0], 'negative': ['7', 0],
+            'latent_image': ['5', 0]}},
+        '8': {'class_type': 'VAEDecode', 'inputs': {'samples': ['3', 0], 'vae': ['4', 2]}},
+        '9': {'class_type': 'SaveImage', 'inputs': {'filename_prefix': 'job', 'images': ['8', 0]}},
+    }
+
+
+class OptimizeWorkflowTest(unittest.TestCase):
+
+    def test_duplicate_nodes_are_merged_into_the_first(self):
+        optimized, report = optimize_workflow(make_workflow())
+        self.assertEqual(report['merged'], {'14': '4'})
+        self.assertNotIn('14', optimized)
+        self.assertEqual(optimized['7']['inputs']['clip'], ['4', 1])
+        self.assertEqual(optimized['3']['inputs']['model'], ['4', 0])
+
+    def test_unused_nodes_are_pruned(self):
+        optimized, report = optimize_workflow(make_workflow())
+        self.assertEqual(report['pruned'], {'45': 'VAELoader'})
+        self.assertEqual(sorted(optimized), ['3', '4', '5', '6', '7', '8', '9'])
+
+    def test_input_is_not_modified(self):
+        workflow = make_workflow()
+        original = copy.deepcopy(workflow)
+        optimize_workflow(workflow)
+        self.assertEqual(workflow, original)
+
+    def test_nodes_merged_downstream_of_duplicates(self):
+        workflow = make_workflow()
+        # Same text on the same (merged) loader: the encoders become duplicates too
+        workflow['7']['inputs']['text'] = 'a cat'
+        optimized, report = optimize_workflow(workflow)
+        self.assertEqual(report['merged'], {'14': '4', '7': '6'})
+        self.assertEqual(optimized['3']['inputs']['negative'], ['6', 0])
+
+    def test_pinned_nodes_are_kept(self):
+        optimized, report = optimize_workflow(make_workflow(), pinned=('14', '45'))
+        self.assertEqual(report, {'merged': {}, 'pruned': {}})
+        self.assertIn('14', optimized)
+        self.assertIn('45', optimized)
+
+    def test_output_nodes_are_never_merged(self):
+        workflow = make_workflow()
+        workflow['10'] = copy.deepcopy(workflow['9'])
+        optimized, report = optimize_workflow(workflow)
+        self.assertIn('9', optimized)
+        self.assertIn('10', optimized)
+        self.assertNotIn('10', report['merged'])
+
+    def test_unknown_output_classes_skip_pruning(self):
+        optimized, report = optimize_workflow(make_workflow(), output_classes=frozenset({'SomethingElse'}))
+        self.assertEqual(report['pruned'], {})
+        self.assertIn('45', optimized)
+
+    def test_output_classes_from_object_info(self):
+        object_info = {'SaveImage': {'output_node': True}, 'VAELoader': {'output_node': False}, 'KSampler': {}}
+        self.assertEqual(output_classes_from_object_info(object_info), frozenset({'SaveImage'}))
+
+    def test_describe_report(self):
+        _, report = optimize_workflow(make_workflow())
+        self.assertEqual(describe_report(report), "pruned 45 (VAELoader); merged 14 into 4")
+        self.assertIsNone(describe_report({'merged': {}, 'pruned': {}}))
+
+
+if __name__ == '__main__':
+    unittest.main()
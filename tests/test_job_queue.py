@@ -0,0 +1,194 @@
+"""Single-flight coalescing and idempotency keys in JobManager (job_queue.py).
+
+Runs against a stub client whose generate() blocks until the test lets it
+finish, so jobs can be held in flight.
+
+    python -m pytest tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from job_queue import IdempotencyConflict, JobManager  # noqa: E402
+
+
+class StubClient:
+    """Stands in for ComfyUIClient; fails the prompts listed in `failing`."""
+
+    def __init__(self, failing=()):
+        self.gate = threading.Event()
+        self.started = threading.Semaphore(0)
+        self.failing = set(failing)
+        self.calls = []
+
+    def generate(self, image1, image2, positive_prompt, negative_prompt, seed=None, template=None, job_id=None):
+        self.calls.append(positive_prompt)
+        self.started.release()
+        self.gate.wait(10)
+        if positive_prompt in self.failing:
+            self.failing.discard(positive_prompt)
+            return {'success': False, 'error': 'boom', 'prompt_id': None}
+        return {'success': True, 'error': None, 'prompt_id': f"prompt-{len(self.calls)}", 'images': [],
+                'seed': seed}
+
+
+class StubWorkflows:
+    """Stands in for WorkflowRegistry: every template has the same hash."""
+
+    def get(self, name):
+        return type('Template', (), {'hash': 'template-hash'})
+
+
+class DuplicateOnLookupCache:
+    """Result cache that always misses, submitting a duplicate during the first lookup."""
+
+    def __init__(self, submit_duplicate):
+        self.submit_duplicate = submit_duplicate
+        self.duplicates = []
+
+    def get(self, key):
+        if self.submit_duplicate is not None:
+            submit, self.submit_duplicate = self.submit_duplicate, None
+            self.duplicates.append(submit())
+        return None
+
+    def put(self, key, images):
+        pass
+
+
+class JobManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.images = []
+        for name in ('a.png', 'b.png'):
+            path = os.path.join(self.folder, name)
+            with open(path, 'wb') as f:
+                f.write(name.encode())
+            self.images.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def make_manager(self, client, **kwargs):
+        # Let blocked workers finish once the test is done
+        self.addCleanup(client.gate.set)
+        return JobManager(client, workers=1, **kwargs)
+
+    def request(self, prompt='a cat', seed=1, key=None):
+        params = {'images': self.images, 'positive_prompt': prompt, 'negative_prompt': 'blurry', 'seed': seed}
+        if key is not None:
+            params['idempotency_key'] = key
+        return params
+
+    def test_duplicate_attaches_to_job_in_flight(self):
+        client = StubClient()
+        jobs = self.make_manager(client)
+        job = jobs.submit(self.request())
+        self.assertIs(jobs.submit(self.request()), job)
+        self.assertEqual(job.coalesced, 1)
+
+        client.gate.set()
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(client.calls, ['a cat'])
+
+    def test_different_seed_is_not_coalesced(self):
+        client = StubClient()
+        jobs = self.make_manager(client)
+        first = jobs.submit(self.request(seed=1))
+        second = jobs.submit(self.request(seed=2))
+        self.assertIsNot(first, second)
+        self.assertEqual(first.coalesced, 0)
+
+    def test_finished_job_is_not_reused_without_key(self):
+        client = StubClient()
+        client.gate.set()
+        jobs = self.make_manager(client)
+        first = jobs.submit(self.request())
+        self.assertTrue(first.wait(5))
+        second = jobs.submit(self.request())
+        self.assertIsNot(second, first)
+        self.assertTrue(second.wait(5))
+        self.assertEqual(len(client.calls), 2)
+
+    def test_idempotency_key_returns_original_job_after_it_finished(self):
+        client = StubClient()
+        client.gate.set()
+        jobs = self.make_manager(client)
+        job = jobs.submit(self.request(key='retry-1'))
+        self.assertTrue(job.wait(5))
+        self.assertIs(jobs.submit(self.request(key='retry-1')), job)
+        self.assertEqual(len(client.calls), 1)
+
+    def test_idempotency_key_reused_for_different_request(self):
+        client = StubClient()
+        jobs = self.make_manager(client)
+        jobs.submit(self.request(key='retry-1'))
+        with self.assertRaises(IdempotencyConflict):
+            jobs.submit(self.request(prompt='a dog', key='retry-1'))
+
+    def test_idempotency_key_of_failed_job_runs_again(self):
+        client = StubClient(failing=['a cat'])
+        client.gate.set()
+        jobs = self.make_manager(client)
+        failed = jobs.submit(self.request(key='retry-1'))
+        self.assertTrue(failed.wait(5))
+        self.assertEqual(failed.status, 'error')
+
+        retry = jobs.submit(self.request(key='retry-1'))
+        self.assertIsNot(retry, failed)
+        self.assertTrue(retry.wait(5))
+        self.assertEqual(retry.status, 'done')
+        self.assertIs(jobs.submit(self.request(key='retry-1')), retry)
+
+    def test_rejected_job_is_not_coalesced_or_published(self):
+        client = StubClient()
+        jobs = self.make_manager(client, max_queue_size=1)
+        running = jobs.submit(self.request(prompt='running'))
+        self.assertTrue(client.started.acquire(timeout=5))
+        queued = jobs.submit(self.request(prompt='queued'))
+        self.assertIsNotNone(queued)
+
+        self.assertIsNone(jobs.submit(self.request(prompt='a cat', key='retry-1')))
+        self.assertIsNone(jobs.submit(self.request(prompt='a cat')))
+        self.assertEqual(len(jobs._jobs), 2)
+        self.assertEqual(jobs._inflight, {running.fingerprint: running, queued.fingerprint: queued})
+
+        client.gate.set()
+        self.assertTrue(queued.wait(5))
+        retry = jobs.submit(self.request(prompt='a cat', key='retry-1'))
+        self.assertIsNotNone(retry)
+        self.assertTrue(retry.wait(5))
+        self.assertEqual(retry.status, 'done')
+        self.assertEqual(client.calls, ['running', 'queued', 'a cat'])
+
+    def test_duplicate_during_submit_of_rejected_job(self):
+        # Regression: submit() used to publish a job before queuing it, so a
+        # duplicate arriving in between attached to a job the full queue then
+        # rejected, and waited on it forever
+        client = StubClient()
+        cache = DuplicateOnLookupCache(None)
+        jobs = self.make_manager(client, max_queue_size=1, result_cache=cache, workflows=StubWorkflows())
+        jobs.submit(self.request(prompt='running'))
+        self.assertTrue(client.started.acquire(timeout=5))
+        queued = jobs.submit(self.request(prompt='queued'))
+
+        cache.submit_duplicate = lambda: jobs.submit(self.request(prompt='a cat'))
+        self.assertIsNone(jobs.submit(self.request(prompt='a cat')))
+        # The queue is still full, so the duplicate is rejected as well
+        self.assertIsNone(cache.duplicates[0])
+
+        client.gate.set()
+        self.assertTrue(queued.wait(5))
+        self.assertEqual(queued.status, 'done')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""Merging of generation graphs into one prompt (micro_batch.py).
+
+    python -m pytest tests
+"""
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from micro_batch import batch_key, merge_workflows  # noqa: E402
+
+
+def make_workflow(prompt, seed, prefix, steps=20):
+    """Minimal text-to-image graph in API format."""
+    return {
+        '4': {'class_type': 'CheckpointLoaderSimple', 'inputs': {'ckpt_name': 'model.safetensors'}},
+        '5': {'class_type': 'EmptyLatentImage', 'inputs': {'width': 512, 'height': 512, 'batch_size': 1}},
+        '6': {'class_type': 'CLIPTextEncode', 'inputs': {'text': prompt, 'clip': ['4', 1]}},
+        '7': {'class_type': 'CLIPTextEncode', 'inputs': {'text': 'blurry', 'clip': ['4', 1]}},
+        '3': {'class_type': 'KSampler', 'inputs': {
+            'seed': seed, 'steps': steps, 'cfg': 7, 'sampler_name': 'euler', 'scheduler': 'normal',
+            'denoise': 1, 'model': ['4', 0], 'positive': ['6', 0], 'negative': ['7', 0],
+            'latent_image': ['5', 0]}},
+        '8': {'class_type': 'VAEDecode', 'inputs': {'samples': ['3', 0], 'vae': ['4', 2]}},
+        '9': {'class_type': 'SaveImage', 'inputs': {'filename_prefix': prefix, 'images': ['8', 0]}},
+    }
+
+
+def nodes_of_class(workflow, class_type):
+    return {node_id: node for node_id, node in workflow.items() if node['class_type'] == class_type}
+
+
+class BatchKeyTest(unittest.TestCase):
+
+    def test_seed_and_prompts_do_not_change_key(self):
+        self.assertEqual(batch_key(make_workflow('a cat', 1, 'job_a')),
+                         batch_key(make_workflow('a dog', 2, 'job_b')))
+
+    def test_sampler_settings_change_key(self):
+        self.assertNotEqual(batch_key(make_workflow('a cat', 1, 'job_a')),
+                            batch_key(make_workflow('a cat', 1, 'job_a', steps=30)))
+
+
+class MergeWorkflowsTest(unittest.TestCase):
+
+    def test_single_workflow_is_unchanged(self):
+        workflow = make_workflow('a cat', 1, 'job_a')
+        self.assertEqual(merge_workflows([workflow]), workflow)
+
+    def test_shared_nodes_are_kept_once(self):
+        merged = merge_workflows([make_workflow('a cat', 1, 'job_a'), make_workflow('a dog', 2, 'job_b')])
+        self.assertEqual(len(nodes_of_class(merged, 'CheckpointLoaderSimple')), 1)
+        self.assertEqual(len(nodes_of_class(merged, 'EmptyLatentImage')), 1)
+        # The identical negative prompt hangs off the shared loader, so it is shared too
+        self.assertEqual(len(nodes_of_class(merged, 'CLIPTextEncode')), 3)
+        self.assertEqual(len(nodes_of_class(merged, 'KSampler')), 2)
+        self.assertEqual(len(nodes_of_class(merged, 'SaveImage')), 2)
+
+    def test_later_nodes_are_renamed_and_relinked(self):
+        first = make_workflow('a cat', 1, 'job_a')
+        merged = merge_workflows([first, make_workflow('a dog', 2, 'job_b')])
+        # The first graph keeps its ids
+        for node_id, node in first.items():
+            self.assertEqual(merged[node_id], node)
+
+        save_id, save = next((node_id, node) for node_id, node in nodes_of_class(merged, 'SaveImage').items()
+                             if node['inputs']['filename_prefix'] == 'job_b')
+        self.assertEqual(save_id, '9_1')
+        decode = merged[save['inputs']['images'][0]]
+        sampler = merged[decode['inputs']['samples'][0]]
+        self.assertEqual(sampler['inputs']['seed'], 2)
+        self.assertEqual(merged[sampler['inputs']['positive'][0]]['inputs']['text'], 'a dog')
+        # Shared upstream nodes are referenced by their id in the first graph
+        self.assertEqual(sampler['inputs']['model'], ['4', 0])
+        self.assertEqual(sampler['inputs']['negative'], ['7', 0])
+        self.assertEqual(sampler['inputs']['latent_image'], ['5', 0])
+
+    def test_every_link_points_at_a_merged_node(self):
+        merged = merge_workflows([make_workflow(f'prompt {i}', i, f'job_{i}') for i in range(3)])
+        for node in merged.values():
+            for value in node['inputs'].values():
+                if isinstance(value, list):
+                    self.assertIn(value[0], merged)
+
+    def test_renamed_id_does_not_collide(self):
+        first = make_workflow('a cat', 1, 'job_a')
+        # The first graph already uses the id a renamed node would get
+        first['9_1'] = {'class_type': 'PreviewImage', 'inputs': {'images': ['8', 0]}}
+        merged = merge_workflows([first, make_workflow('a dog', 2, 'job_b')])
+        self.assertEqual(merged['9_1']['class_type'], 'PreviewImage')
+        prefixes = sorted(node['inputs']['filename_prefix'] for node in nodes_of_class(merged, 'SaveImage').values())
+        self.assertEqual(prefixes, ['job_a', 'job_b'])
+        self.assertEqual(len(merged), len(first) + 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
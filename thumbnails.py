@@ -0,0 +1,105 @@
+"""Resized WebP/AVIF variants of generated images.
+
+`/generated/<file>?w=256&fmt=webp` is served from a variant rendered with
+Pillow on a small thread pool (resizing and encoding release the GIL) and
+stored next to the original as `thumb_<name>_<digest>_w<width>.<fmt>`. The
+source digest in the name keeps variants of rewritten files such as
+latest_image.png from going stale. Variants are registered with the retention
+janitor like any other output.
+"""
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, features
+
+from content_store import atomic_write, file_digest
+
+VARIANT_PREFIX = 'thumb_'
+
+# fmt -> (Pillow format, mimetype, save options)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'avif': ('AVIF', 'image/avif', {'quality': 60}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True}),
+    'png': ('PNG', 'image/png', {'optimize': True}),
+}
+
+
+def format_supported(fmt):
+    """True when this Pillow build can encode `fmt`."""
+    if fmt not in FORMATS:
+        return False
+    if fmt in ('webp', 'avif'):
+        return bool(features.check(fmt))
+    return True
+
+
+class ThumbnailService:
+    """Renders and caches resized variants; concurrent requests for one variant share a render."""
+
+    def __init__(self, folder, widths=(128, 256, 512), default_width=256, default_format='webp',
+                 workers=2, retention=None):
+        self.folder = folder
+        self.widths = tuple(widths)
+        self.default_width = default_width
+        self.default_format = default_format
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnails')
+        self._pending = {}  # variant path -> Future
+        self._lock = threading.Lock()
+
+    def variant_path(self, filename, width, fmt):
+        source = os.path.join(self.folder, filename)
+        stem = os.path.splitext(filename)[0]
+        name = f"{VARIANT_PREFIX}{stem}_{file_digest(source)[:12]}_w{width}.{fmt}"
+        return os.path.join(self.folder, name)
+
+    def submit(self, filename, width=None, fmt=None):
+        """Start rendering a variant unless it exists or is already being rendered; returns a Future or None."""
+        width = width or self.default_width
+        fmt = fmt or self.default_format
+        dst_path = self.variant_path(filename, width, fmt)
+        if os.path.exists(dst_path):
+            return None
+        with self._lock:
+            future = self._pending.get(dst_path)
+            if future is None:
+                future = self._executor.submit(self._render, os.path.join(self.folder, filename), dst_path, width, fmt)
+                self._pending[dst_path] = future
+                future.add_done_callback(lambda _: self._forget(dst_path))
+        return future
+
+    def _forget(self, dst_path):
+        with self._lock:
+            self._pending.pop(dst_path, None)
+
+    def get(self, filename, width, fmt, timeout=30):
+        """Return the path of the variant, rendering it first if needed."""
+        future = self.submit(filename, width, fmt)
+        if future is not None:
+            future.result(timeout)
+        return self.variant_path(filename, width, fmt)
+
+    def prewarm(self, image_path):
+        """Render the default preview of a new output in the background."""
+        try:
+            self.submit(os.path.basename(image_path))
+        except OSError as e:
+            print(f"[THUMBS] Cannot prepare preview of {image_path}: {e}")
+
+    def _render(self, src_path, dst_path, width, fmt):
+        pil_format, _, options = FORMATS[fmt]
+        with Image.open(src_path) as img:
+            if img.width > width:
+                height = max(1, round(img.height * width / img.width))
+                img = img.resize((width, height), Image.LANCZOS)
+            if fmt == 'jpeg' and img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            buffer = io.BytesIO()
+            img.save(buffer, format=pil_format, **options)
+        atomic_write(dst_path, buffer.getbuffer())
+        if self.retention is not None:
+            self.retention.track('generated', dst_path)
+        return dst_path
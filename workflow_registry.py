@@ -0,0 +1,198 @@
+"""Registry of ComfyUI workflow templates.
+
+Templates are API-format workflow files in the workflows folder, listed in
+`templates.json` with their patch points: the (node id, input) pairs a
+request fills in. Files are parsed once and read again only when they change
+on disk, so templates can be edited or added while the server runs.
+
+Each template is run through the graph optimizer once at load (patch point
+nodes are pinned), so unused nodes such as the spare VAELoader are gone
+before any instance is built.
+
+Instances share every node a request does not touch with the template;
+building one costs a dict copy plus the few patched nodes. Code that edits a
+workflow must therefore replace nodes (`workflow[id] = dict(node, ...)`)
+instead of mutating them in place.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from graph_optimizer import describe_report, optimize_workflow
+from micro_batch import is_link
+
+MANIFEST_NAME = 'templates.json'
+
+PATCH_POINTS = ('image_a', 'image_b', 'positive', 'negative', 'seed', 'prefix')
+
+
+class WorkflowTemplate:
+    """One parsed workflow graph plus the inputs a request patches."""
+
+    def __init__(self, name, graph, patch_points, description='', path=None, mtime=None):
+        self.name = name
+        self.graph = graph
+        self.patch_points = {point: tuple(target) for point, target in patch_points.items()}
+        self.description = description
+        self.path = path
+        self.mtime = mtime
+        self.check()
+        pinned = {node_id for node_id, _ in self.patch_points.values()}
+        self.graph, self.optimization = optimize_workflow(graph, pinned=pinned)
+        # Identifies the template in result-cache keys; changes whenever the graph does
+        self.hash = hashlib.sha256(json.dumps([self.graph, patch_points], sort_keys=True).encode()).hexdigest()
+        self.output_node = self.patch_points['prefix'][0]
+
+    def check(self):
+        """Raise ValueError unless the graph is in API format and every patch point resolves."""
+        missing = [point for point in PATCH_POINTS if point not in self.patch_points]
+        if missing:
+            raise ValueError(f"missing patch points: {', '.join(missing)}")
+        for node_id, node in self.graph.items():
+            if 'class_type' not in node or not isinstance(node.get('inputs'), dict):
+                raise ValueError(f"node {node_id} is not in API format")
+            for name, value in node['inputs'].items():
+                if is_link(value) and value[0] not in self.graph:
+                    raise ValueError(f"node {node_id} input {name} links to unknown node {value[0]}")
+        for point, (node_id, _) in self.patch_points.items():
+            if node_id not in self.graph:
+                raise ValueError(f"patch point {point} names unknown node {node_id}")
+
+    def instantiate(self, values):
+        """Build a workflow with `values` (patch point -> value) filled in."""
+        workflow = dict(self.graph)
+        for point, value in values.items():
+            node_id, input_name = self.patch_points[point]
+            node = workflow[node_id]
+            if node is self.graph[node_id]:
+                node = workflow[node_id] = dict(node, inputs=dict(node['inputs']))
+            node['inputs'][input_name] = value
+        return workflow
+
+    def read(self, workflow, point):
+        node_id, input_name = self.patch_points[point]
+        return workflow[node_id]['inputs'].get(input_name)
+
+    def validate(self, object_info):
+        """Return the problems running this template on a backend with this /object_info."""
+        problems = []
+        for node_id, node in self.graph.items():
+            if node['class_type'] not in object_info:
+                problems.append(f"node {node_id}: unknown node type {node['class_type']}")
+        for point, (node_id, input_name) in self.patch_points.items():
+            info = object_info.get(self.graph[node_id]['class_type'])
+            if info is None:
+                continue
+            inputs = info.get('input', {})
+            if input_name not in inputs.get('required', {}) and input_name not in inputs.get('optional', {}):
+                problems.append(f"patch point {point}: {self.graph[node_id]['class_type']} has no input {input_name}")
+        return problems
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'description': self.description,
+            'nodes': len(self.graph),
+            'hash': self.hash,
+            'patchPoints': {point: list(target) for point, target in self.patch_points.items()},
+            'optimized': describe_report(self.optimization),
+        }
+
+
+class WorkflowRegistry:
+    """Templates from a workflows folder, reloaded when the manifest or a file changes."""
+
+    def __init__(self, folder, reload_interval=2):
+        self.folder = folder
+        # Seconds between mtime checks; None disables hot reload
+        self.reload_interval = reload_interval
+        self.default = None
+        self._templates = {}
+        self._manifest_mtime = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self.reload()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.folder, MANIFEST_NAME)
+
+    def reload(self):
+        """Re-read the manifest and every changed template; broken templates keep their last good version."""
+        with self._lock:
+            try:
+                manifest_mtime = os.path.getmtime(self.manifest_path)
+                with open(self.manifest_path, encoding='utf-8-sig') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[WORKFLOWS] Cannot read {self.manifest_path}: {e}")
+                return
+
+            templates = {}
+            for name, spec in manifest.get('templates', {}).items():
+                current = self._templates.get(name)
+                try:
+                    path = os.path.join(self.folder, spec['file'])
+                    mtime = os.path.getmtime(path)
+                    if current and current.mtime == mtime and manifest_mtime == self._manifest_mtime:
+                        templates[name] = current
+                        continue
+                    with open(path, encoding='utf-8-sig') as f:
+                        graph = json.load(f)
+                    templates[name] = WorkflowTemplate(name, graph, spec['patch_points'],
+                                                       spec.get('description', ''), path, mtime)
+                    template = templates[name]
+                    summary = describe_report(template.optimization)
+                    print(f"[WORKFLOWS] Loaded template {name} ({len(template.graph)} nodes)"
+                          f"{'; ' + summary if summary else ''}")
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    print(f"[WORKFLOWS] Template {name} is invalid: {e}")
+                    if current:
+                        templates[name] = current
+
+            self._templates = templates
+            self.default = manifest.get('default') if manifest.get('default') in templates else next(iter(templates), None)
+            self._manifest_mtime = manifest_mtime
+            self._checked_at = time.time()
+
+    def _changed(self):
+        try:
+            if os.path.getmtime(self.manifest_path) != self._manifest_mtime:
+                return True
+        except OSError:
+            return False
+        for template in self._templates.values():
+            try:
+                if os.path.getmtime(template.path) != template.mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def _maybe_reload(self):
+        if self.reload_interval is None or time.time() - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = time.time()
+        if self._changed():
+            self.reload()
+
+    def get(self, name=None):
+        """Return the named template (the default one for None); raises KeyError if unknown."""
+        self._maybe_reload()
+        template = self._templates.get(name or self.default)
+        if template is None:
+            raise KeyError(f"Unknown workflow template: {name}")
+        return template
+
+    def names(self):
+        self._maybe_reload()
+        return list(self._templates)
+
+    def describe(self):
+        self._maybe_reload()
+        return {
+            'default': self.default,
+            'templates': [template.describe() for template in self._templates.values()],
+        }